@@ -0,0 +1,252 @@
+# basket_engine.py
+import sys, json, datetime as dt
+from typing import Optional
+import numpy as np
+import pandas as pd
+
+import returns_store
+from db import get_client, fetch_all, upsert_rows
+
+# --------- Config ---------
+DEFAULT_BASE_VALUE = 100.0
+STATE_LOOKBACK_DAYS = 30          # how far back to look for a basket's last stored level
+LEVEL_SOURCE = "basket"           # factor_values.source for levels written here
+CHUNK_BASKETS = 50                # baskets per vectorized pass (arrays are chunk x T x that chunk's members)
+# baskets.method -> how member weights are set at each reconstitution; the
+# table has no market caps, so cap_weight uses basket_members.weight as the
+# cap snapshot (fixed weights that drift with prices until the next change)
+WEIGHTING = {"equal_weight": "equal", "cap_weight": "fixed", "fixed_weight": "fixed"}
+# --------------------------
+
+def json_rows(df: pd.DataFrame) -> list:
+    return json.loads(df.to_json(orient="records"))
+
+def load_baskets(sb, slugs=None):
+    def q(table, cols):
+        b = sb.table(table).select(cols)
+        if slugs:
+            b = b.in_("slug", slugs)
+        return b.order("slug")
+    baskets = pd.DataFrame(fetch_all(lambda: q("baskets", "slug, name, method, base_dt, base_value")),
+                           columns=["slug", "name", "method", "base_dt", "base_value"])
+    members = pd.DataFrame(fetch_all(lambda: q("basket_members", "slug, ticker, weight, valid_from, valid_to").order("ticker")),
+                           columns=["slug", "ticker", "weight", "valid_from", "valid_to"])
+    members["ticker"] = members["ticker"].str.upper()
+    members["weight"] = pd.to_numeric(members["weight"], errors="coerce")
+    for c in ("valid_from", "valid_to"):
+        members[c] = pd.to_datetime(members[c])
+    baskets["base_dt"] = pd.to_datetime(baskets["base_dt"])
+    return baskets, members
+
+def membership_weights(members: pd.DataFrame, baskets: pd.DataFrame, dates: pd.DatetimeIndex, tickers: list) -> np.ndarray:
+    """
+    B x T x N target weights. Each member interval [valid_from, valid_to] (inclusive,
+    open when valid_to is null) becomes two searchsorted endpoints plus a cumsum
+    along time, so no per-date filtering happens.
+    """
+    B, T, N = len(baskets), len(dates), len(tickers)
+    b_pos = {s: i for i, s in enumerate(baskets["slug"])}
+    t_pos = {t: i for i, t in enumerate(tickers)}
+    bi = members["slug"].map(b_pos).to_numpy()
+    ni = members["ticker"].map(t_pos).to_numpy()
+    i0 = dates.searchsorted(members["valid_from"].to_numpy(), side="left")
+    i1 = np.where(members["valid_to"].isna(), T,
+                  dates.searchsorted(members["valid_to"].fillna(dates.max()).to_numpy(), side="right"))
+
+    fixed = (baskets["method"].map(WEIGHTING) == "fixed").to_numpy()
+    w = np.where(fixed[bi], members["weight"].fillna(0.0).to_numpy(), 1.0)
+
+    D = np.zeros((B, T + 1, N))
+    np.add.at(D, (bi, i0, ni), w)
+    np.add.at(D, (bi, i1, ni), -w)
+    W = np.cumsum(D[:, :T, :], axis=1)
+    W[np.abs(W) < 1e-12] = 0.0
+    tot = W.sum(axis=2, keepdims=True)
+    return np.divide(W, tot, out=np.zeros_like(W), where=tot > 0)
+
+def basket_growth(W: np.ndarray, rets: np.ndarray, resets: Optional[np.ndarray] = None,
+                  h0: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    B x T cumulative growth. Weights are reset to target at the close before
+    each reconstitution (and before any extra B x T `resets`) and drift with
+    prices in between; each segment chains onto the previous one.
+    rets is T x N log returns (NaN = no print, held flat). h0 (B x N) carries
+    holdings already drifted at the first close into the first segment instead
+    of resetting to target there; rows of NaN start at target as usual.
+    """
+    B, T, N = W.shape
+    r = np.nan_to_num(rets, nan=0.0)
+    r[0] = 0.0                                          # window starts at a close
+    C = np.cumsum(r, axis=0)                            # log price relative to window start
+
+    carry = np.zeros(B, dtype=bool) if h0 is None else ~np.isnan(h0).any(axis=1)
+    change = np.ones((B, T), dtype=bool)
+    change[:, 1:] = np.any(W[:, 1:] != W[:, :-1], axis=2)
+    if resets is not None:
+        change |= resets
+    change[carry, 0] = False
+    seg = np.maximum.accumulate(np.where(change, np.arange(T)[None, :], 0), axis=1)
+
+    # holdings over day t were set at close seg-1 and drifted to close t-1
+    prev = np.maximum(np.arange(T) - 1, 0)
+    anchor = np.maximum(seg - 1, 0)
+    base = W
+    if carry.any():
+        base = np.where(((seg == 0) & carry[:, None])[:, :, None], np.nan_to_num(h0)[:, None, :], W)
+    h = base * np.exp(C[prev][None, :, :] - C[anchor])
+    hs = h.sum(axis=2)
+    day = np.einsum("btn,tn->bt", h, np.expm1(r))
+    ret = np.divide(day, hs, out=np.zeros_like(day), where=hs > 0)
+    return np.cumprod(1.0 + ret, axis=1)
+
+def last_levels(sb, slugs) -> pd.DataFrame:
+    since = (dt.date.today() - dt.timedelta(days=STATE_LOOKBACK_DAYS)).strftime("%Y-%m-%d")
+    rows = fetch_all(lambda: (
+        sb.table("factor_values")
+          .select("slug, dt, level")
+          .in_("slug", slugs)
+          .gte("dt", since)
+          .not_.is_("level", "null")
+          .order("slug").order("dt")
+    ))
+    df = pd.DataFrame(rows, columns=["slug", "dt", "level"])
+    df["dt"] = pd.to_datetime(df["dt"])
+    df["level"] = pd.to_numeric(df["level"], errors="coerce")
+    return df.groupby("slug").last()
+
+def target_weights(m: pd.DataFrame, on: pd.Timestamp, fixed: bool) -> pd.Series:
+    """One basket's normalized target weights on a single date (same rules as membership_weights)."""
+    live = m[(m["valid_from"] <= on) & (m["valid_to"].isna() | (m["valid_to"] >= on))]
+    w = live.groupby("ticker")["weight"].sum() if fixed else live.groupby("ticker").size().astype(float)
+    w = w[w.abs() >= 1e-12]
+    return (w / w.sum()).round(12) if w.sum() > 0 else w.iloc[:0]
+
+def segment_start(m: pd.DataFrame, base_dt: pd.Timestamp, on: pd.Timestamp,
+                  dates: pd.DatetimeIndex, fixed: bool) -> pd.Timestamp:
+    """
+    Start of the holding period in force on date `on` for one basket's members
+    `m`: the latest membership edge after launch that changes the target weights
+    between consecutive `dates` (as basket_growth sees it), else the launch.
+    """
+    launch = base_dt + pd.Timedelta(days=1)
+    edges = pd.concat([m["valid_from"], m["valid_to"].dropna() + pd.Timedelta(days=1)])
+    for e in sorted(set(edges[(edges > launch) & (edges <= on)]), reverse=True):
+        i = dates.searchsorted(e)
+        if i == 0 or not target_weights(m, dates[i - 1], fixed).equals(target_weights(m, dates[i], fixed)):
+            return e
+    return launch
+
+def chunk_levels(baskets: pd.DataFrame, members: pd.DataFrame, prices: pd.DataFrame,
+                 rets: pd.DataFrame, state: pd.DataFrame) -> list:
+    """
+    Level frames for one chunk of baskets, over that chunk's own members only.
+    A chunk is either all new (launched at base_dt) or all incremental from one
+    shared last stored date, where each basket restarts from its drifted
+    holdings at that close rather than replaying its segment from the anchor.
+    """
+    members = members[members["slug"].isin(baskets["slug"])]
+    tickers = sorted(members["ticker"].unique())
+    fixed = (baskets["method"].map(WEIGHTING) == "fixed").to_numpy()
+    incremental = baskets["slug"].iloc[0] in state.index
+    if incremental:
+        ref_dt = state.loc[baskets["slug"].iloc[0], "dt"]
+        start = rets.index[rets.index.searchsorted(ref_dt, side="right") - 1]
+    else:
+        start = baskets["base_dt"].min() - pd.Timedelta(days=7)      # keep the close before launch
+    r = rets.reindex(columns=tickers).loc[start:]
+    dates = r.index
+    W = membership_weights(members, baskets, dates, tickers)
+
+    h0, launch = None, None
+    if incremental:
+        # drifted holdings at the start close: target weights x price relative since the anchor close
+        px = prices.reindex(columns=tickers).ffill().bfill()
+        h0 = np.empty((len(baskets), len(tickers)))
+        for k, (_, b) in enumerate(baskets.iterrows()):
+            seg = segment_start(members[members["slug"] == b["slug"]], b["base_dt"], start, prices.index, fixed[k])
+            anchor = prices.index[max(prices.index.searchsorted(seg) - 1, 0)]
+            h0[k] = W[k, 0] * (px.loc[start] / px.loc[anchor]).fillna(1.0).to_numpy()
+    else:
+        # the index launches at base_dt: holdings reset to target at that close
+        launch = np.zeros((len(baskets), len(dates)), dtype=bool)
+        i_base = dates.searchsorted(baskets["base_dt"].to_numpy(), side="right")
+        ok = i_base < len(dates)
+        launch[np.flatnonzero(ok), i_base[ok]] = True
+    G = basket_growth(W, r.to_numpy(), launch, h0)
+    printed = np.einsum("btn,tn->bt", (W > 0).astype(float), r.notna().to_numpy(dtype=float)) > 0
+
+    out = []
+    for k, (_, b) in enumerate(baskets.iterrows()):
+        if incremental:
+            ref_dt, ref_level = state.loc[b["slug"], "dt"], float(state.loc[b["slug"], "level"])
+            keep = dates > ref_dt
+        else:
+            ref_dt, ref_level = b["base_dt"], float(b["base_value"])
+            keep = dates >= ref_dt
+        i_ref = dates.searchsorted(ref_dt, side="right") - 1
+        level = ref_level * G[k] / G[k, i_ref]
+        keep = keep & (printed[k] | (dates == ref_dt))
+        out.append(pd.DataFrame({"slug": b["slug"], "dt": dates[keep], "level": level[keep]}))
+    return out
+
+def run(sb, slugs=None, full: bool = False, chunk: int = CHUNK_BASKETS) -> int:
+    baskets, members = load_baskets(sb, slugs)
+    unknown = set(baskets["method"]) - set(WEIGHTING)
+    if unknown:
+        print(f"[WARN] Skipping baskets with unsupported method(s): {sorted(unknown)}")
+        baskets = baskets[baskets["method"].isin(WEIGHTING)]
+    members = members[members["slug"].isin(baskets["slug"])]
+    if baskets.empty or members.empty:
+        print("[WARN] No baskets with members to compute.")
+        return 0
+    baskets = baskets.reset_index(drop=True)
+
+    first_member = members.groupby("slug")["valid_from"].min()
+    baskets["base_dt"] = baskets["base_dt"].fillna(baskets["slug"].map(first_member))
+    baskets["base_value"] = pd.to_numeric(baskets["base_value"], errors="coerce").fillna(DEFAULT_BASE_VALUE)
+
+    state = pd.DataFrame(columns=["dt", "level"]) if full else last_levels(sb, baskets["slug"].tolist())
+
+    tickers = sorted(members["ticker"].unique())
+    # the store is backfilled once to the earliest launch, so old baskets can be (re)built
+    prices, rets = returns_store.update(sb, tickers, since_dt=baskets["base_dt"].min() - pd.Timedelta(days=7))
+    missing = [t for t in tickers if t not in rets.columns]
+    if missing:
+        print(f"[WARN] No prices for basket members: {missing} (held flat)")
+
+    inc = baskets["slug"].isin(state.index)
+    ref = baskets["slug"].map(state["dt"]).where(inc, baskets["base_dt"])
+    early = ref.isna() | (ref < rets.index.min()) if len(rets) else pd.Series(True, index=baskets.index)
+    if early.any():
+        print(f"[WARN] Skipping baskets undated or dated before the first stored price "
+              f"({rets.index.min().date() if len(rets) else 'n/a'}): {baskets.loc[early, 'slug'].tolist()}")
+        baskets, inc, ref = baskets[~early], inc[~early], ref[~early]
+
+    # new baskets in launch order; incremental ones grouped by their last stored date
+    groups = [baskets[~inc].sort_values("base_dt")] + [g for _, g in baskets[inc].groupby(ref[inc])]
+    out = []
+    for g in groups:
+        for lo in range(0, len(g), chunk):
+            out += chunk_levels(g.iloc[lo:lo + chunk], members, prices, rets, state)
+
+    series = baskets.assign(category="basket")[["slug", "name", "category", "method"]]
+    upsert_rows(sb, "factor_series", json_rows(series), on_conflict="slug")
+    df = pd.concat(out, ignore_index=True) if out else pd.DataFrame(columns=["slug", "dt", "level"])
+    if df.empty:
+        print("[SKIP] Basket levels already up to date.")
+        return 0
+    df["dt"] = df["dt"].dt.strftime("%Y-%m-%d")
+    df["source"] = LEVEL_SOURCE
+    df["r_1d"] = None                                   # (re)written levels are pending for factor_stats
+    n = upsert_rows(sb, "factor_values", json_rows(df), on_conflict="slug,dt")
+    print(f"[OK] Baskets: upserted {n} levels for {df['slug'].nunique()} baskets "
+          f"({len(tickers)} members, chunks of {chunk})")
+    return n
+
+def main():
+    full = "--full" in sys.argv
+    slugs = [a for a in sys.argv[1:] if not a.startswith("--")] or None
+    run(get_client(), slugs, full=full)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# blockwise_cov.py
+import json
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# --------- Config ---------
+TILE = 1024                    # tickers per column tile; peak memory ~ T*TILE*2 + TILE^2 floats
+TOP_K = 10                     # how many highest / lowest correlation pairs to keep
+ANNUALIZATION_FACTOR = 252
+# --------------------------
+
+def tickers_path(npy_path: Path) -> Path:
+    return Path(npy_path).with_suffix(".tickers.json")
+
+def write_returns_memmap(rets: pd.DataFrame, path: Path, tile: int = TILE) -> np.memmap:
+    """Dump a dense returns panel (T x N) to a .npy memmap, one column tile at a time."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    T, N = rets.shape
+    mm = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=(T, N))
+    for j0 in range(0, N, tile):
+        mm[:, j0:j0 + tile] = rets.iloc[:, j0:j0 + tile].to_numpy(dtype=np.float64)
+    mm.flush()
+    tickers_path(path).write_text(json.dumps(rets.columns.tolist()))
+    return mm
+
+def load_matrix(path: Path, mmap_mode: str = "r") -> pd.DataFrame:
+    """Wrap a square .npy result (and its tickers file) as a DataFrame view, without copying."""
+    tickers = json.loads(tickers_path(path).read_text())
+    return pd.DataFrame(np.load(path, mmap_mode=mmap_mode), index=tickers, columns=tickers, copy=False)
+
+def _extremes(vals: np.ndarray, k: int, largest: bool):
+    """Flat indices of the k largest (or smallest) finite entries of a tile."""
+    flat = vals.ravel()
+    ok = np.flatnonzero(np.isfinite(flat))
+    if ok.size == 0:
+        return ok
+    k = min(k, ok.size)
+    key = -flat[ok] if largest else flat[ok]
+    return ok[np.argpartition(key, k - 1)[:k]]
+
+def blockwise_cov(returns_path: Path, cov_path: Path, corr_path: Path, tile: int = TILE,
+                  af: float = ANNUALIZATION_FACTOR, top_k: int = TOP_K):
+    """
+    Annualized sample covariance and correlation of a memory-mapped T x N
+    returns panel, written tile by tile into N x N .npy memmaps. Each upper
+    tile pair is one BLAS product of centered column tiles, mirrored into the
+    lower half. Correlation and the top/bottom pairs come from the same tile in
+    that pass. Returns (top_pairs, bottom_pairs) as lists of (a, b, rho).
+    """
+    R = np.load(returns_path, mmap_mode="r")
+    tickers = json.loads(tickers_path(returns_path).read_text())
+    T, N = R.shape
+    scale = af / (T - 1)
+
+    # column means and (annualized) std in one streaming pass
+    mu, sd = np.empty(N), np.empty(N)
+    for j0 in range(0, N, tile):
+        X = np.asarray(R[:, j0:j0 + tile])
+        mu[j0:j0 + tile] = X.mean(axis=0)
+        sd[j0:j0 + tile] = np.sqrt(((X - mu[j0:j0 + tile]) ** 2).sum(axis=0) * scale)
+    sd = np.where(sd == 0.0, np.finfo(float).eps, sd)
+
+    cov = np.lib.format.open_memmap(cov_path, mode="w+", dtype=np.float64, shape=(N, N))
+    corr = np.lib.format.open_memmap(corr_path, mode="w+", dtype=np.float64, shape=(N, N))
+    cand = []                                             # (rho, i, j) candidates per tile
+    for i0 in range(0, N, tile):
+        i1 = min(i0 + tile, N)
+        Xi = np.asarray(R[:, i0:i1]) - mu[i0:i1]
+        for j0 in range(i0, N, tile):
+            j1 = min(j0 + tile, N)
+            Xj = Xi if j0 == i0 else np.asarray(R[:, j0:j1]) - mu[j0:j1]
+            C = (Xi.T @ Xj) * scale
+            P = C / np.outer(sd[i0:i1], sd[j0:j1])
+            cov[i0:i1, j0:j1], corr[i0:i1, j0:j1] = C, P
+            if j0 != i0:
+                cov[j0:j1, i0:i1], corr[j0:j1, i0:i1] = C.T, P.T
+
+            # pairs: strict upper triangle only on diagonal tiles
+            Q = P.copy()
+            if j0 == i0:
+                Q[np.tril_indices_from(Q)] = np.nan
+            for largest in (True, False):
+                for f in _extremes(Q, top_k, largest):
+                    r, c = divmod(int(f), Q.shape[1])
+                    cand.append((float(Q[r, c]), i0 + r, j0 + c))
+    cov.flush()
+    corr.flush()
+    tickers_path(cov_path).write_text(json.dumps(tickers))
+    tickers_path(corr_path).write_text(json.dumps(tickers))
+
+    cand = sorted(set(cand))
+    top = [(tickers[i], tickers[j], r) for r, i, j in cand[::-1][:top_k]]
+    bottom = [(tickers[i], tickers[j], r) for r, i, j in cand[:top_k]]
+    return top, bottom
@@ -0,0 +1,113 @@
+# clustering.py
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+# -------- Config --------
+OUTDIR = Path("outputs")
+CORR_FILE = OUTDIR / "corr_annual.csv"     # written by compute_cov.py
+LINKAGE_METHOD = "single"                  # tree used by HRP: single | complete | average
+LABEL_LINKAGE_METHOD = "complete"          # tree used for labels (single linkage chains into one big group)
+N_CLUSTERS = 8                             # how many groups to cut the tree into for labels
+# ------------------------
+
+def load_corr(path: Path = CORR_FILE) -> pd.DataFrame:
+    if not path.exists():
+        raise FileNotFoundError(f"Missing correlation file: {path}")
+    corr = pd.read_csv(path, index_col=0)
+    assert (corr.columns == corr.index).all(), "Corr CSV must have same row/column tickers in same order"
+    return corr
+
+def cov_to_corr(cov: pd.DataFrame) -> pd.DataFrame:
+    std = np.sqrt(np.diag(cov.values))
+    std = np.where(std == 0.0, np.finfo(float).eps, std)
+    return pd.DataFrame(cov.values / np.outer(std, std), index=cov.index, columns=cov.columns)
+
+def corr_distance(corr: np.ndarray) -> np.ndarray:
+    """Correlation distance d_ij = sqrt((1 - rho_ij) / 2), in [0, 1]."""
+    d = np.sqrt(np.clip((1.0 - np.asarray(corr, dtype=float)) / 2.0, 0.0, 1.0))
+    np.fill_diagonal(d, 0.0)
+    return d
+
+def linkage(dist: np.ndarray, method: str = LINKAGE_METHOD) -> np.ndarray:
+    """
+    Agglomerative clustering on a precomputed N x N distance matrix using
+    Lance–Williams updates (the distances are never recomputed from data).
+    Returns a scipy-style (N-1) x 4 linkage matrix: [id_a, id_b, dist, size],
+    where ids >= N refer to the cluster formed at row (id - N).
+    """
+    if method not in ("single", "complete", "average"):
+        raise ValueError(f"Unknown linkage method: {method}")
+    D = np.array(dist, dtype=float, copy=True)
+    n = D.shape[0]
+    np.fill_diagonal(D, np.inf)
+    ids = np.arange(n)
+    sizes = np.ones(n)
+    Z = np.zeros((max(n - 1, 0), 4))
+
+    for k in range(n - 1):
+        i, j = divmod(int(np.argmin(D)), n)
+        if i > j:
+            i, j = j, i
+        size = sizes[i] + sizes[j]
+        Z[k] = [min(ids[i], ids[j]), max(ids[i], ids[j]), D[i, j], size]
+
+        if method == "single":
+            new = np.minimum(D[i], D[j])
+        elif method == "complete":
+            new = np.maximum(D[i], D[j])
+        else:
+            new = (sizes[i] * D[i] + sizes[j] * D[j]) / size
+
+        # merged cluster lives on in row/col i; row/col j is retired
+        D[i, :] = new
+        D[:, i] = new
+        D[i, i] = np.inf
+        D[j, :] = np.inf
+        D[:, j] = np.inf
+        sizes[i] = size
+        ids[i] = n + k
+    return Z
+
+def leaf_order(Z: np.ndarray) -> list:
+    """Quasi-diagonal ordering: leaves of the tree read left to right."""
+    n = Z.shape[0] + 1
+    order, stack = [], [2 * n - 2]
+    while stack:
+        c = stack.pop()
+        if c < n:
+            order.append(c)
+        else:
+            a, b = Z[c - n, :2].astype(int)
+            stack.append(b)
+            stack.append(a)
+    return order
+
+def cut_tree(Z: np.ndarray, n_clusters: int) -> list:
+    """Undo the last (n_clusters - 1) merges; returns a list of leaf-index lists."""
+    n = Z.shape[0] + 1
+    n_clusters = max(1, min(n_clusters, n))
+    members = {i: [i] for i in range(n)}
+    for k in range(n - n_clusters):
+        a, b = Z[k, :2].astype(int)
+        members[n + k] = members.pop(a) + members.pop(b)
+    return list(members.values())
+
+def cluster_labels(corr: pd.DataFrame, n_clusters: int = N_CLUSTERS, method: str = LABEL_LINKAGE_METHOD) -> dict:
+    """
+    {ticker: label} from the correlation tree. Each group is named after its
+    medoid (the member closest on average to the rest); singletons keep their ticker.
+    """
+    tickers = corr.index.tolist()
+    dist = corr_distance(corr.values)
+    groups = cut_tree(linkage(dist, method), n_clusters)
+    labels = {}
+    for g in groups:
+        if len(g) == 1:
+            name = tickers[g[0]]
+        else:
+            medoid = g[int(np.argmin(dist[np.ix_(g, g)].sum(axis=1)))]
+            name = f"{tickers[medoid]} group"
+        for i in g:
+            labels[tickers[i]] = name
+    return labels
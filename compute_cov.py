@@ -1,9 +1,14 @@
 # compute_cov.py
-import os, sys, json, datetime as dt
+import os, sys, json, glob, datetime as dt
 import numpy as np
 import pandas as pd
-from supabase import create_client
-from dotenv import load_dotenv
+
+import cov_cache
+import returns_store
+import universe
+import blockwise_cov
+import data_quality
+from db import get_client
 
 # --------- Config ---------
 TICKERS_FILE = "tickers.txt"            # one ticker per line
@@ -12,22 +17,30 @@ ANNUALIZATION_FACTOR = 252              # trading days per year
 
 USE_LEDOIT_WOLF = True                  # set False if you didn't install scikit-learn
 HALFLIFE_EWMA = 21                      # ~1 month; change to 60/126 for smoother EWMA
+USE_CACHE = True                        # memoize estimators on disk (see cov_cache.py)
+USE_RETURNS_STORE = True                # read returns from the incremental store (see returns_store.py)
+UNIVERSE = None                         # e.g. "core": take tickers from universe_membership instead of tickers.txt
+AS_OF = None                            # "YYYY-MM-DD": end the window here and use the universe as of that date
+UNIVERSE_MASK = True                    # pairwise mode: count a name's returns only on dates it was a universe member
+BLOCKWISE_MIN_TICKERS = 2000            # at or above this many names, use the out-of-core tiled path
+COV_MODE = "complete"                   # "complete": dates where every name prints; "pairwise": each pair's own overlap
+PAIRWISE_MIN_OBS = 60                   # pairs with fewer overlapping days get zero correlation before the PSD repair
+USE_DQ = True                           # scan prices and apply per-ticker include/ffill/exclude (see data_quality.py)
+WINSOR_SIGMA = 4.0                      # clip each ticker's returns at mean ± k·σ before Ledoit–Wolf; None to skip
+WINSOR_FILE = f"cov_annual_winsor{WINSOR_SIGMA or 0:g}sigma.csv"   # output name; compute_erc / risk_service read it from here
+ROBUST_ESTIMATORS = []                  # extra robust scenarios, any of "mcd" (needs scikit-learn), "huber"
+HUBER_K = 2.5                           # Huber tuning constant on the Mahalanobis distance
 # --------------------------
 
 def load_tickers(path=TICKERS_FILE):
     with open(path, "r") as f:
         return [line.strip().upper() for line in f if line.strip()]
 
-def get_client():
-    load_dotenv()
-    url = os.environ["SUPABASE_URL"]
-    key = os.environ["SUPABASE_ANON_KEY"]
-    return create_client(url, key)
-
-def fetch_adj_close(sb, tickers, start_dt, end_dt):
+def fetch_adj_close(sb, tickers, start_dt, end_dt, join="inner"):
     """
     Pull adj_close for all tickers between start_dt and end_dt (inclusive).
     Returns a wide DataFrame: index=dt (datetime), columns=tickers, values=adj_close.
+    join="outer" keeps every date and leaves gaps as NaN for the data-quality stage.
     """
     frames = []
     for t in tickers:
@@ -50,6 +63,8 @@ def fetch_adj_close(sb, tickers, start_dt, end_dt):
 
     if not frames:
         raise SystemExit("[ERROR] No data retrieved for any ticker.")
+    if join == "outer":
+        return pd.concat(frames, axis=1, join="outer").sort_index()
     # Inner-join on dates so all columns share the same rows (avoid look-ahead bias)
     wide = pd.concat(frames, axis=1, join="inner").sort_index()
     # Drop any residual NaNs (if any)
@@ -59,6 +74,46 @@ def fetch_adj_close(sb, tickers, start_dt, end_dt):
 def compute_log_returns(prices: pd.DataFrame) -> pd.DataFrame:
     return np.log(prices).diff().dropna(how="any")
 
+def pairwise_cov(returns: pd.DataFrame, min_obs=PAIRWISE_MIN_OBS, af=ANNUALIZATION_FACTOR, repair=True):
+    """
+    Pairwise-complete sample covariance of a panel with gaps (NaN = no print),
+    from three matrix products over the validity mask M and zero-filled X:
+    counts N = M'M, sums S = X'M (S_ij = sum of x_i where j also printed) and
+    cross-products P = X'X. cov_ij = (P_ij - S_ij S_ji / N_ij) / (N_ij - 1).
+    The result is generally not PSD, so it is repaired with nearest_psd.
+    """
+    M = returns.notna().to_numpy(dtype=float)
+    X = np.nan_to_num(returns.to_numpy(dtype=float))
+    N, S, P = M.T @ M, X.T @ M, X.T @ X
+    with np.errstate(divide="ignore", invalid="ignore"):
+        C = (P - S * S.T / N) / (N - 1.0)
+    thin = N < min_obs
+    np.fill_diagonal(thin, np.diag(N) < 2)
+    if thin[~np.eye(len(C), dtype=bool)].any():
+        print(f"[WARN] Pairwise covariance: {int(np.triu(thin, 1).sum())} pairs with < {min_obs} "
+              "overlapping days set to zero correlation")
+    C[thin] = 0.0
+    cov = pd.DataFrame(C * af, index=returns.columns, columns=returns.columns)
+    return nearest_psd(cov) if repair else cov
+
+def nearest_psd(cov: pd.DataFrame, eps=1e-10) -> pd.DataFrame:
+    """
+    PSD repair that keeps every variance: clip the correlation matrix's
+    eigenvalues at eps, rescale it back to a unit diagonal, and scale by the
+    original standard deviations.
+    """
+    sd = np.sqrt(np.clip(np.diag(cov.values), 0.0, None))
+    sd_safe = np.where(sd == 0.0, 1.0, sd)
+    R = cov.values / np.outer(sd_safe, sd_safe)
+    R = (R + R.T) / 2.0
+    w, V = np.linalg.eigh(R)
+    if w.min() >= eps:
+        return cov
+    R = (V * np.clip(w, eps, None)) @ V.T
+    d = np.sqrt(np.diag(R))
+    R = R / np.outer(d, d)
+    return pd.DataFrame(R * np.outer(sd, sd), index=cov.index, columns=cov.columns)
+
 def sample_cov(returns: pd.DataFrame, annualize=True, af=ANNUALIZATION_FACTOR) -> pd.DataFrame:
     cov_d = returns.cov()     # daily sample covariance
     return cov_d * af if annualize else cov_d
@@ -88,30 +143,217 @@ def ledoit_wolf_cov(returns: pd.DataFrame, af=ANNUALIZATION_FACTOR):
     cov = pd.DataFrame(lw.covariance_, index=returns.columns, columns=returns.columns)
     return cov * af
 
+def winsorize(returns: pd.DataFrame, k=WINSOR_SIGMA) -> pd.DataFrame:
+    """Clip each column at its own mean ± k·std (one vectorized clip over the panel)."""
+    mu, sd = returns.mean(), returns.std()
+    return returns.clip(lower=mu - k * sd, upper=mu + k * sd, axis=1)
+
+def winsor_lw_cov(returns: pd.DataFrame, k=WINSOR_SIGMA, af=ANNUALIZATION_FACTOR):
+    return ledoit_wolf_cov(winsorize(returns, k), af=af)
+
+def mcd_cov(returns: pd.DataFrame, af=ANNUALIZATION_FACTOR):
+    try:
+        from sklearn.covariance import MinCovDet
+    except Exception as e:
+        raise RuntimeError("scikit-learn not installed. Run: pip install scikit-learn") from e
+    mcd = MinCovDet(random_state=0).fit(returns.values)
+    return pd.DataFrame(mcd.covariance_, index=returns.columns, columns=returns.columns) * af
+
+def huber_cov(returns: pd.DataFrame, k=HUBER_K, af=ANNUALIZATION_FACTOR, max_iters=100, tol=1e-8):
+    """
+    Huber M-estimate of location/scatter by iterative reweighting: days whose
+    Mahalanobis distance exceeds k get weight k/d, everything else weight 1.
+    """
+    X = returns.values
+    mu, S = X.mean(axis=0), np.cov(X, rowvar=False)
+    for _ in range(max_iters):
+        Z = X - mu
+        d = np.sqrt(np.einsum("ij,ij->i", Z @ np.linalg.pinv(S), Z))
+        w = np.minimum(1.0, k / np.maximum(d, 1e-12))
+        mu_new = (w[:, None] * X).sum(axis=0) / w.sum()
+        Z = X - mu_new
+        S_new = (w[:, None] ** 2 * Z).T @ Z / (w ** 2).sum()
+        done = np.abs(S_new - S).max() < tol * np.abs(S).max()
+        mu, S = mu_new, S_new
+        if done:
+            break
+    return pd.DataFrame(S, index=returns.columns, columns=returns.columns) * af
+
+ESTIMATORS = {
+    "sample": sample_cov,
+    "ewma": ewma_cov,
+    "ledoit_wolf": ledoit_wolf_cov,
+    "winsor_lw": winsor_lw_cov,
+    "mcd": mcd_cov,
+    "huber": huber_cov,
+    "pairwise": pairwise_cov,
+}
+
+def get_cov(sb, tickers, start_dt, end_dt, method="ledoit_wolf", **params) -> pd.DataFrame:
+    """
+    Annualized covariance for (tickers, window, method, params), served from the
+    disk cache when prices_daily has no newer data for the set; prices are only
+    fetched on a miss.
+    """
+    key = cov_cache.cov_key(tickers, start_dt, end_dt, method, params,
+                            cov_cache.data_watermark(sb, tickers))
+
+    def compute():
+        if method == "pairwise":                  # keep every date; gaps stay NaN
+            prices = fetch_adj_close(sb, tickers, start_dt, end_dt, join="outer")
+            return pairwise_cov(one_period_returns(prices, returns_store.log_returns(prices)), **params)
+        return ESTIMATORS[method](compute_log_returns(fetch_adj_close(sb, tickers, start_dt, end_dt)), **params)
+    return cov_cache.memoize(key, compute)
+
+def complete_returns(rets: pd.DataFrame, dates: pd.DatetimeIndex) -> pd.DataFrame:
+    """
+    Per-ticker returns (each against that name's previous print) restricted to
+    the complete-price dates. Returns on dropped days fold into the next kept
+    date, so every row covers the same interval for every ticker, as an
+    inner-join-then-diff would. The first kept date is dropped if earlier rows
+    were folded into it, because their spans start at different points.
+    """
+    out = data_quality.fold_returns(rets, dates)
+    if len(dates) and (rets.index < dates[0]).any():
+        out = out.iloc[1:]
+    return out.dropna(how="any")
+
+def one_period_returns(prices: pd.DataFrame, rets: pd.DataFrame) -> pd.DataFrame:
+    """
+    Pairwise panel: keep a return only where the ticker printed on both this
+    and the previous panel date, so a value never spans a gap (NaN stays NaN
+    and the validity mask in pairwise_cov sees it as missing).
+    """
+    ok = prices.notna() & prices.shift(1).notna()
+    return rets.reindex(index=prices.index, columns=prices.columns).where(ok).iloc[1:]
+
+def print_pairs(top, bottom):
+    print("\nTop 10 correlations:")
+    for a, b, r in top[:10]:
+        print(f"{a}-{b}: {r:.3f}")
+
+    print("\nBottom 10 correlations:")
+    for a, b, r in bottom[:10]:
+        print(f"{a}-{b}: {r:.3f}")
+
+def run_blockwise(rets: pd.DataFrame, outdir: str):
+    """
+    Large-universe path: returns go to a memmap, covariance / correlation are
+    built tile by tile into outputs/*.npy (see blockwise_cov.py) and never held
+    in RAM. EWMA and Ledoit–Wolf are in-memory estimators and are skipped here.
+    Dense CSVs left by an earlier (smaller) run are removed, so compute_erc,
+    compute_hrp, risk_service and the cluster labels fail loudly instead of
+    reading a stale universe.
+    """
+    stale = sorted(set(glob.glob(os.path.join(outdir, "cov_*.csv")))
+                   | {os.path.join(outdir, f) for f in ("corr_annual.csv", "prices_adj_close.csv", "returns_log_daily.csv")})
+    for path in stale:
+        if os.path.exists(path):
+            os.remove(path)
+            print(f"[WARN] Removed stale {path} (superseded by the blockwise .npy outputs)")
+    R_path = os.path.join(".cache", "blockwise", "returns_log_daily.npy")
+    blockwise_cov.write_returns_memmap(rets, R_path)
+    top, bottom = blockwise_cov.blockwise_cov(
+        R_path,
+        os.path.join(outdir, "cov_annual.npy"),
+        os.path.join(outdir, "corr_annual.npy"),
+        af=ANNUALIZATION_FACTOR,
+    )
+    print_pairs(top, bottom)
+    print(f"\n[INFO] Blockwise mode ({rets.shape[1]} tickers): wrote cov_annual.npy / corr_annual.npy; "
+          "EWMA and Ledoit–Wolf skipped.")
+
 def main():
     # load tickers and time window
-    tickers = load_tickers()
-    end_dt = dt.date.today()
+    end_dt = dt.date.fromisoformat(AS_OF) if AS_OF else dt.date.today()
     start_dt = end_dt - dt.timedelta(days=int(YEARS * 365))
+    sb = get_client()
+    members = None
+    if UNIVERSE:
+        # point-in-time membership avoids survivorship bias in historical runs
+        members = universe.load_universe_index(sb)
+        tickers = members.as_of(UNIVERSE, end_dt)
+        if not tickers:
+            raise SystemExit(f"[ERROR] Universe '{UNIVERSE}' has no members on {end_dt}.")
+    else:
+        tickers = load_tickers()
 
     print(f"[INFO] Building covariance from adj_close for {len(tickers)} tickers")
     print(f"[INFO] Window: {start_dt} → {end_dt} (~{YEARS}y)")
-    sb = get_client()
 
     # 1) prices → 2) returns
-    prices = fetch_adj_close(sb, tickers, start_dt, end_dt)
+    if USE_RETURNS_STORE:
+        # store returns are per-ticker (vs each name's previous print)
+        # since_dt backfills the store so historical (AS_OF) windows are not cut short
+        prices_all, rets_all = returns_store.update(sb, tickers, since_dt=start_dt)
+        cols = [t for t in tickers if t in prices_all.columns]
+        window = slice(pd.Timestamp(start_dt), pd.Timestamp(end_dt))
+        prices, rets = prices_all.loc[window, cols], rets_all.loc[window, cols]
+        first = prices.dropna(how="all").index.min()
+        if pd.isna(first) or first > pd.Timestamp(start_dt) + pd.Timedelta(days=7):   # a week covers holidays
+            print(f"[WARN] Stored prices start at {first.date() if pd.notna(first) else 'n/a'}, "
+                  f"after the window start {start_dt}; prices_daily has no earlier rows for these tickers.")
+    else:
+        prices = fetch_adj_close(sb, tickers, start_dt, end_dt, join="outer" if USE_DQ else "inner")
+        rets = None
+
+    if USE_DQ:
+        # one vectorized scan decides, per ticker, include / forward-fill / exclude
+        report, ref_dates = data_quality.scan(prices)
+        print(f"[INFO] Data-quality report: {data_quality.write_report(report)}")
+        data_quality.summarize(report)
+        if COV_MODE == "pairwise":
+            # same filtering, but gaps stay NaN: forward-filled prices / zero returns would
+            # pull variances and correlations toward zero and defeat the validity mask
+            prices_panel = data_quality.clean_prices(prices, report, ref_dates, fill=False)
+            rets_panel = returns_store.log_returns(prices_panel) if rets is None else \
+                data_quality.clean_returns(rets, report, ref_dates, fill=False)
+        prices = data_quality.clean_prices(prices, report, ref_dates)
+        rets = returns_store.log_returns(prices).iloc[1:] if rets is None else \
+            data_quality.clean_returns(rets, report, ref_dates)
+    elif rets is None:
+        rets = returns_store.log_returns(prices).iloc[1:]
+    if COV_MODE == "pairwise" and not USE_DQ:
+        prices_panel, rets_panel = prices, rets
+    if COV_MODE == "pairwise":
+        rets_panel = one_period_returns(prices_panel, rets_panel)
+        if members is not None and UNIVERSE_MASK:
+            # each pair's overlap is limited to dates both names were in the universe
+            rets_panel = rets_panel.where(members.mask(UNIVERSE, rets_panel.index, rets_panel.columns))
+
+    # complete rows for everything except the pairwise estimator
+    prices = prices.dropna(how="any")
+    rets = complete_returns(rets, prices.index)
     print(f"[INFO] Prices shape: {prices.shape} (rows=trading days, cols=tickers)")
-    rets = compute_log_returns(prices)
     print(f"[INFO] Returns shape: {rets.shape}")
+    if COV_MODE == "pairwise":
+        print(f"[INFO] Pairwise mode: {rets_panel.notna().sum().sum()} return observations "
+              f"vs {rets.size} in complete rows")
+
+    watermark = cov_cache.data_watermark(sb, tickers) if USE_CACHE else None
 
-    # 3) sample covariance (daily and annualized)
-    cov_annual = sample_cov(rets, annualize=True)
-    cov_daily  = sample_cov(rets, annualize=False)
+    def estimate(method, data=rets, **params):
+        if watermark is None:
+            return ESTIMATORS[method](data, **params)
+        key = cov_cache.cov_key(data.columns.tolist(), start_dt, end_dt, method, params, watermark,
+                                cov_cache.frame_hash(data))
+        return cov_cache.memoize(key, lambda: ESTIMATORS[method](data, **params))
 
     # Prepare output dir early (so we can save correlation too)
     outdir = "outputs"
     os.makedirs(outdir, exist_ok=True)
 
+    if rets.shape[1] >= BLOCKWISE_MIN_TICKERS:
+        run_blockwise(rets, outdir)
+        return
+
+    # 3) sample covariance (daily and annualized); pairwise mode uses every overlapping day per pair
+    if COV_MODE == "pairwise":
+        cov_annual = estimate("pairwise", data=rets_panel, min_obs=PAIRWISE_MIN_OBS)
+    else:
+        cov_annual = estimate("sample", annualize=True)
+    cov_daily  = cov_annual / ANNUALIZATION_FACTOR
+
     # --- Correlation matrix from cov_annual ---
     std = np.sqrt(np.diag(cov_annual.values))
     # Guard against zero std (avoid divide-by-zero)
@@ -127,32 +369,48 @@ def main():
         for j in range(i + 1, len(cols)):
             pairs.append((cols[i], cols[j], float(corr.iloc[i, j])))
     pairs_sorted = sorted(pairs, key=lambda x: x[2], reverse=True)
-
-    print("\nTop 10 correlations:")
-    for a, b, r in pairs_sorted[:10]:
-        print(f"{a}-{b}: {r:.3f}")
-
-    print("\nBottom 10 correlations:")
-    for a, b, r in sorted(pairs, key=lambda x: x[2])[:10]:
-        print(f"{a}-{b}: {r:.3f}")
+    print_pairs(pairs_sorted, sorted(pairs, key=lambda x: x[2]))
 
     # 4) optional EWMA and Ledoit–Wolf (annualized)
-    cov_ewma = ewma_cov(rets)  # annualized
+    cov_ewma = estimate("ewma", halflife=HALFLIFE_EWMA)  # annualized
     cov_lw   = None
     if USE_LEDOIT_WOLF:
         try:
-            cov_lw = ledoit_wolf_cov(rets)
+            cov_lw = estimate("ledoit_wolf")
         except Exception as e:
             print(f"[WARN] Ledoit-Wolf skipped: {e}")
 
+    # 5) robust scenarios from the same return panel (compute_erc picks these up)
+    cov_winsor = None
+    if USE_LEDOIT_WOLF and WINSOR_SIGMA:
+        try:
+            cov_winsor = estimate("winsor_lw", k=WINSOR_SIGMA)
+        except Exception as e:
+            print(f"[WARN] Winsorized LW skipped: {e}")
+    cov_robust = {}
+    for method in ROBUST_ESTIMATORS:
+        try:
+            cov_robust[method] = estimate(method)
+        except Exception as e:
+            print(f"[WARN] {method} skipped: {e}")
+
     # Save core outputs
-    prices.to_csv(os.path.join(outdir, "prices_adj_close.csv"))
-    rets.to_csv(os.path.join(outdir, "returns_log_daily.csv"))
+    if COV_MODE == "pairwise":
+        prices_panel.to_csv(os.path.join(outdir, "prices_adj_close.csv"))
+        rets_panel.to_csv(os.path.join(outdir, "returns_log_daily.csv"))
+        cov_annual.to_csv(os.path.join(outdir, "cov_annual_pairwise.csv"))
+    else:
+        prices.to_csv(os.path.join(outdir, "prices_adj_close.csv"))
+        rets.to_csv(os.path.join(outdir, "returns_log_daily.csv"))
     cov_daily.to_csv(os.path.join(outdir, "cov_daily.csv"))
     cov_annual.to_csv(os.path.join(outdir, "cov_annual.csv"))
     cov_ewma.to_csv(os.path.join(outdir, f"cov_annual_ewma_hl{HALFLIFE_EWMA}.csv"))
     if cov_lw is not None:
         cov_lw.to_csv(os.path.join(outdir, "cov_annual_ledoit_wolf.csv"))
+    if cov_winsor is not None:
+        cov_winsor.to_csv(os.path.join(outdir, WINSOR_FILE))
+    for method, cov in cov_robust.items():
+        cov.to_csv(os.path.join(outdir, f"cov_annual_{method}.csv"))
 
     # Small on-screen summary
     print("\n[SUMMARY]")
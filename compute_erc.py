@@ -5,11 +5,21 @@ import pandas as pd
 from pathlib import Path
 from typing import Optional, Tuple
 
+import risk_attribution
+from clustering import load_corr, cluster_labels
+from compute_cov import WINSOR_FILE as WINSOR_NAME
+
 # -------- Config --------
 OUTDIR = Path("outputs")
 LW_FILE = OUTDIR / "cov_annual_ledoit_wolf.csv"
 EWMA_FILE = OUTDIR / "cov_annual_ewma_hl21.csv"            # optional
-WINSOR_FILE = OUTDIR / "cov_annual_winsor4sigma.csv"        # optional (if you created it)
+BLOCKWISE_FILE = OUTDIR / "cov_annual.npy"                 # compute_cov blockwise mode writes this instead of CSVs
+WINSOR_FILE = OUTDIR / WINSOR_NAME                          # optional (compute_cov WINSOR_SIGMA)
+EXTRA_FILES = {                                             # optional (compute_cov ROBUST_ESTIMATORS / COV_MODE)
+    "mcd":      ("ERC — Minimum covariance determinant", OUTDIR / "cov_annual_mcd.csv"),
+    "huber":    ("ERC — Huber M-estimate", OUTDIR / "cov_annual_huber.csv"),
+    "pairwise": ("ERC — Pairwise-complete sample (PSD-repaired)", OUTDIR / "cov_annual_pairwise.csv"),
+}
 
 RISK_SHARE_CAP = 0.10     # 10% max per-name risk share (soft penalty)
 WEIGHT_CAP = None         # e.g., 0.08 to hard-cap weights; None to disable
@@ -25,6 +35,10 @@ def load_cov(path: Path) -> pd.DataFrame:
     cov = (cov + cov.T) / 2.0  # enforce symmetry
     return cov
 
+def blockwise_only() -> bool:
+    """compute_cov last ran in blockwise mode: .npy tiles only, no dense covariance CSVs to solve on."""
+    return BLOCKWISE_FILE.exists() and not LW_FILE.exists()
+
 def blend_cov(cov_a: pd.DataFrame, cov_b: pd.DataFrame, alpha: float) -> pd.DataFrame:
     assert (cov_a.index == cov_b.index).all() and (cov_a.columns == cov_b.columns).all()
     return alpha * cov_a + (1.0 - alpha) * cov_b
@@ -110,6 +124,10 @@ def erc_optimize(
             break
         w = w_new
 
+    return portfolio_stats(S, w, tickers)
+
+def portfolio_stats(S: np.ndarray, w: np.ndarray, tickers: list) -> Tuple[pd.Series, pd.Series, float, pd.Series]:
+    """weights, risk_shares, portfolio_vol, risk_contrib_vol for a given weight vector."""
     RC = risk_contribs(S, w)                     # variance units
     port_var = float(w.T @ S @ w)
     port_vol = float(np.sqrt(port_var))
@@ -119,8 +137,12 @@ def erc_optimize(
     w_s = pd.Series(w, index=tickers, name="weight")
     return w_s, shares, port_vol, RC_vol
 
-def save_panel(title: str, cov: pd.DataFrame, out_stub: str):
+def save_panel(title: str, cov: pd.DataFrame, out_stub: str) -> pd.Series:
     w, s, vol, rc_vol = erc_optimize(cov)
+    write_panel(title, w, s, vol, rc_vol, out_stub)
+    return w
+
+def write_panel(title: str, w: pd.Series, s: pd.Series, vol: float, rc_vol: pd.Series, out_stub: str):
     df = pd.concat([w, s, rc_vol], axis=1)  # weight (fraction), risk_share (fraction), risk_contrib_vol (abs vol)
     df_sorted = df.sort_values("risk_share", ascending=False)
     df_sorted.to_csv(OUTDIR / f"{out_stub}.csv")
@@ -138,15 +160,19 @@ def save_panel(title: str, cov: pd.DataFrame, out_stub: str):
 
 def main():
     os.makedirs(OUTDIR, exist_ok=True)
+    if blockwise_only():
+        raise SystemExit(f"[ERROR] {BLOCKWISE_FILE} is a blockwise covariance (universe >= compute_cov "
+                         f"BLOCKWISE_MIN_TICKERS); ERC needs the dense {LW_FILE}. Run compute_cov on a smaller universe.")
 
     # --- Ledoit–Wolf baseline ---
     cov_lw = load_cov(LW_FILE)
-    save_panel("ERC — Ledoit–Wolf (baseline)", cov_lw, "erc_ledoit_wolf")
+    solved = {}                                   # scenario -> (weights, cov) for the attribution table
+    solved["ledoit_wolf"] = (save_panel("ERC — Ledoit–Wolf (baseline)", cov_lw, "erc_ledoit_wolf"), cov_lw)
 
     # --- Winsorized + LW (optional) ---
     if WINSOR_FILE.exists():
         cov_w = load_cov(WINSOR_FILE).reindex(index=cov_lw.index, columns=cov_lw.columns)
-        save_panel("ERC — Winsorized returns + LW", cov_w, "erc_winsor_lw")
+        solved["winsor_lw"] = (save_panel("ERC — Winsorized returns + LW", cov_w, "erc_winsor_lw"), cov_w)
     else:
         print("\n[INFO] Skipping 'Winsorized + LW' (file not found).")
 
@@ -154,9 +180,25 @@ def main():
     if EWMA_FILE.exists():
         cov_ewma = load_cov(EWMA_FILE).reindex(index=cov_lw.index, columns=cov_lw.columns)
         cov_blend = blend_cov(cov_lw, cov_ewma, alpha=0.70)
-        save_panel("ERC — 70/30 LW/EWMA blend", cov_blend, "erc_blend_70_30")
+        solved["blend_70_30"] = (save_panel("ERC — 70/30 LW/EWMA blend", cov_blend, "erc_blend_70_30"), cov_blend)
     else:
         print("\n[INFO] Skipping '70/30 LW/EWMA' (EWMA file not found).")
 
+    # --- Other estimators (optional) ---
+    for name, (title, path) in EXTRA_FILES.items():
+        if path.exists():
+            cov_r = load_cov(path).reindex(index=cov_lw.index, columns=cov_lw.columns)
+            solved[name] = (save_panel(title, cov_r, f"erc_{name}"), cov_r)
+
+    # --- Risk attribution for every scenario in one batched pass ---
+    weights = pd.DataFrame({k: w for k, (w, _) in solved.items()}).T.rename_axis("scenario")
+    try:
+        clusters = cluster_labels(load_corr())
+    except FileNotFoundError:
+        clusters = None
+    table = risk_attribution.attribution_table(weights, {k: c for k, (_, c) in solved.items()}, clusters)
+    path = risk_attribution.write_table(table)
+    print(f"\n[OK] Risk attribution: {len(table)} rows for {len(weights)} scenarios -> {path}")
+
 if __name__ == "__main__":
     main()
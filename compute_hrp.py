@@ -0,0 +1,57 @@
+# compute_hrp.py
+import os
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from clustering import cov_to_corr, corr_distance, linkage, leaf_order, LINKAGE_METHOD
+from compute_erc import load_cov, portfolio_stats, write_panel
+
+# -------- Config --------
+OUTDIR = Path("outputs")
+LW_FILE = OUTDIR / "cov_annual_ledoit_wolf.csv"
+# ------------------------
+
+def cluster_var(S: np.ndarray, idx: np.ndarray) -> float:
+    """Variance of the inverse-variance portfolio inside one cluster."""
+    sub = S[np.ix_(idx, idx)]
+    ivp = 1.0 / np.diag(sub)
+    ivp /= ivp.sum()
+    return float(ivp @ sub @ ivp)
+
+def hrp_weights(S: np.ndarray, order: list) -> np.ndarray:
+    """
+    Recursive bisection over the quasi-diagonal order (López de Prado, 2016).
+    Each split divides weight between the two halves inversely to their
+    cluster variance. No matrix inversion, O(N^2) work per tree level.
+    """
+    w = np.ones(S.shape[0])
+    clusters = [np.asarray(order)]
+    while clusters:
+        nxt = []
+        for c in clusters:
+            if len(c) < 2:
+                continue
+            half = len(c) // 2
+            left, right = c[:half], c[half:]
+            v_l, v_r = cluster_var(S, left), cluster_var(S, right)
+            alpha = 1.0 - v_l / (v_l + v_r)
+            w[left] *= alpha
+            w[right] *= 1.0 - alpha
+            nxt += [left, right]
+        clusters = nxt
+    return w / w.sum()
+
+def hrp_optimize(cov: pd.DataFrame, method: str = LINKAGE_METHOD):
+    """Same return shape as compute_erc.erc_optimize."""
+    S = cov.values.astype(float)
+    order = leaf_order(linkage(corr_distance(cov_to_corr(cov).values), method))
+    return portfolio_stats(S, hrp_weights(S, order), cov.index.tolist())
+
+def main():
+    os.makedirs(OUTDIR, exist_ok=True)
+    cov_lw = load_cov(LW_FILE)
+    write_panel("HRP — Ledoit–Wolf", *hrp_optimize(cov_lw), "hrp_ledoit_wolf")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# cov_cache.py
+import os, json, hashlib
+from pathlib import Path
+from typing import Callable, Optional
+import pandas as pd
+
+from db import in_batches
+
+# --------- Config ---------
+CACHE_DIR = Path(".cache") / "cov"
+MAX_CACHE_BYTES = 512 * 1024 ** 2        # disk budget; least-recently-used entries are evicted past this
+# --------------------------
+
+def data_watermark(sb, tickers) -> str:
+    """
+    Latest prices_daily.updated_at across the ticker set. Any new or re-adjusted
+    row for one of the tickers moves it, which changes every key built on it.
+    One query per ticker batch keeps each request URL short.
+    """
+    marks = []
+    for batch in in_batches(tickers):
+        r = (
+            sb.table("prices_daily")
+              .select("updated_at")
+              .in_("ticker", batch)
+              .order("updated_at", desc=True)
+              .limit(1)
+              .execute()
+        )
+        marks += [row["updated_at"] for row in r.data if row["updated_at"]]
+    return max(marks, default="")
+
+def frame_hash(df: pd.DataFrame) -> str:
+    """Content hash of a return panel (values, dates and tickers)."""
+    h = hashlib.sha256(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    h.update(json.dumps([str(c) for c in df.columns]).encode())
+    return h.hexdigest()
+
+def cov_key(tickers, start_dt, end_dt, method: str, params: dict, watermark: str, data_hash: str = "") -> str:
+    """
+    data_hash (see frame_hash) pins the key to the exact panel the estimator
+    sees, so upstream choices (DQ policy, returns store, row filtering) that
+    change the panel also change the key.
+    """
+    payload = {
+        "tickers": sorted(t.upper() for t in tickers),
+        "start": str(start_dt),
+        "end": str(end_dt),
+        "method": method,
+        "params": params,
+        "watermark": watermark,
+        "data": data_hash,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+def _path(key: str) -> Path:
+    return CACHE_DIR / f"{key}.pkl"
+
+def load(key: str) -> Optional[pd.DataFrame]:
+    path = _path(key)
+    if not path.exists():
+        return None
+    try:
+        df = pd.read_pickle(path)
+    except Exception:
+        path.unlink(missing_ok=True)      # corrupt / partial entry
+        return None
+    os.utime(path)                        # mtime doubles as the LRU clock
+    return df
+
+def store(key: str, df: pd.DataFrame, max_bytes: int = MAX_CACHE_BYTES):
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = _path(key).with_suffix(".tmp")
+    df.to_pickle(tmp)
+    os.replace(tmp, _path(key))           # atomic, so readers never see half a file
+    evict(max_bytes)
+
+def evict(max_bytes: int = MAX_CACHE_BYTES):
+    """Drop least-recently-used entries until the cache fits the disk budget."""
+    if not CACHE_DIR.exists():
+        return
+    entries = sorted((p.stat().st_mtime, p.stat().st_size, p) for p in CACHE_DIR.glob("*.pkl"))
+    total = sum(size for _, size, _ in entries)
+    for _, size, p in entries:
+        if total <= max_bytes:
+            break
+        p.unlink(missing_ok=True)
+        total -= size
+
+def memoize(key: str, compute: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+    df = load(key)
+    if df is None:
+        df = compute()
+        store(key, df)
+    return df
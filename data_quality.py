@@ -0,0 +1,161 @@
+# data_quality.py
+import os, sys
+import numpy as np
+import pandas as pd
+
+import returns_store
+from db import get_client
+
+# --------- Config ---------
+OUTDIR = "outputs"
+REPORT_FILE = "dq_report.csv"
+CALENDAR_QUORUM = 0.5         # a date is on the reference calendar if >= this share of live tickers print
+MIN_COVERAGE = 0.80           # below this share of reference dates printed -> exclude
+MAX_FFILL_GAP = 5             # longest missing run (reference dates) still forward-filled
+STALE_RUN_EXCLUDE = 10        # this many identical consecutive prints -> exclude (dead / frozen feed)
+OUTLIER_MADS = 10.0           # |return - median| above this many robust sigmas is flagged
+# --------------------------
+
+def longest_run(b: np.ndarray) -> np.ndarray:
+    """Longest run of True down each column of a T x N boolean matrix."""
+    if b.shape[0] == 0:
+        return np.zeros(b.shape[1], dtype=int)
+    c = np.cumsum(b, axis=0)
+    base = np.maximum.accumulate(np.where(~b, c, 0), axis=0)
+    return (c - base).max(axis=0)
+
+def active_span(valid: np.ndarray) -> np.ndarray:
+    """True between each ticker's first and last print (inclusive)."""
+    return (np.cumsum(valid, axis=0) > 0) & (np.cumsum(valid[::-1], axis=0)[::-1] > 0)
+
+def scan(prices: pd.DataFrame):
+    """
+    One vectorized pass over a wide adj_close panel (NaN = no print).
+    Returns (report, ref_dates): a per-ticker report with the chosen policy
+    ('include' | 'ffill' | 'exclude') and the reference trading calendar.
+    """
+    P = prices.to_numpy(dtype=float)
+    valid = ~np.isnan(P)
+    live = active_span(valid)
+
+    # reference calendar: dates most live tickers agree on
+    share = valid.sum(axis=1) / np.maximum(live.sum(axis=1), 1)
+    on_ref = share >= CALENDAR_QUORUM
+    ref_dates = prices.index[on_ref]
+
+    ref_live = live & on_ref[:, None]
+    missing = ref_live & ~valid
+    off_cal = valid & ~on_ref[:, None]
+    n_ref = ref_live.sum(axis=0)
+
+    nonpos = valid & (P <= 0)
+    prev = pd.DataFrame(np.where(valid & ~nonpos, P, np.nan)).ffill().shift(1).to_numpy()
+    stale = valid & (P == prev)
+
+    r = returns_store.log_returns(prices.where(prices > 0)).to_numpy()
+    med = np.nanmedian(r, axis=0) if len(r) else np.full(P.shape[1], np.nan)
+    mad = np.nanmedian(np.abs(r - med), axis=0) * 1.4826 if len(r) else np.full(P.shape[1], np.nan)
+    z = np.abs(r - med) / np.where(mad > 0, mad, np.nan)
+
+    first = np.where(valid.any(axis=0), valid.argmax(axis=0), -1)
+    last = np.where(valid.any(axis=0), len(P) - 1 - valid[::-1].argmax(axis=0), -1)
+    report = pd.DataFrame({
+        "first_dt": [prices.index[i].date() if i >= 0 else None for i in first],
+        "last_dt": [prices.index[i].date() if i >= 0 else None for i in last],
+        "n_obs": valid.sum(axis=0),
+        "coverage": np.divide((ref_live & valid).sum(axis=0), n_ref, out=np.zeros(P.shape[1]), where=n_ref > 0),
+        "missing_days": missing.sum(axis=0),
+        "max_gap": longest_run(missing),
+        "off_calendar": off_cal.sum(axis=0),
+        "stale_max_run": longest_run(stale) + np.where(stale.any(axis=0), 1, 0),
+        "nonpositive": nonpos.sum(axis=0),
+        "outliers": np.nansum(z > OUTLIER_MADS, axis=0),
+        "max_abs_z": np.nanmax(np.where(np.isfinite(z), z, -np.inf), axis=0).clip(min=0),
+    }, index=prices.columns)
+    report.index.name = "ticker"
+
+    reason = np.select(
+        [report["n_obs"] == 0,
+         report["coverage"] < MIN_COVERAGE,
+         report["stale_max_run"] >= STALE_RUN_EXCLUDE,
+         report["max_gap"] > MAX_FFILL_GAP],
+        ["no data", "low coverage", "stale prints", "gap too long"], default="")
+    report["policy"] = np.where(reason != "", "exclude",
+                                np.where(report["missing_days"] > 0, "ffill", "include"))
+    report["reason"] = reason
+    return report, ref_dates
+
+def clean_prices(prices: pd.DataFrame, report: pd.DataFrame, ref_dates: pd.DatetimeIndex,
+                 fill: bool = True) -> pd.DataFrame:
+    """
+    Reference calendar only, excluded tickers dropped, bad prints removed,
+    short gaps forward-filled (fill=False leaves the gaps as NaN).
+    """
+    keep = report.index[report["policy"] != "exclude"]
+    out = prices.loc[prices.index.isin(ref_dates), keep]
+    out = out.where(out > 0)
+    ff = report.index[report["policy"] == "ffill"].intersection(keep)
+    if fill and len(ff):
+        live = pd.DataFrame(active_span(out[ff].notna().to_numpy()), index=out.index, columns=ff)
+        out[ff] = out[ff].ffill(limit=MAX_FFILL_GAP).where(live)
+    return out
+
+def fold_returns(rets: pd.DataFrame, dates: pd.DatetimeIndex) -> pd.DataFrame:
+    """
+    Log returns re-based onto `dates`: each row is summed into the next date in
+    `dates` (exact for log returns), so every kept date covers the same
+    interval for every ticker. Rows after the last date are dropped (not yet settled).
+    """
+    bucket = dates.searchsorted(rets.index, side="left")
+    rets, bucket = rets[bucket < len(dates)], bucket[bucket < len(dates)]
+    out = rets.groupby(bucket).sum(min_count=1)
+    out.index = dates[out.index]
+    return out.reindex(dates)
+
+def clean_returns(rets: pd.DataFrame, report: pd.DataFrame, ref_dates: pd.DatetimeIndex,
+                  fill: bool = True) -> pd.DataFrame:
+    """
+    Per-ticker log returns (e.g. from returns_store) mapped onto the reference
+    calendar without going back to prices. Off-calendar returns fold into the
+    next reference date, which is exact for log returns. For ffill tickers a
+    missing reference day becomes 0, the same as carrying the last price
+    (fill=False leaves it NaN).
+    """
+    keep = report.index[report["policy"] != "exclude"]
+    out = fold_returns(rets[keep].where(np.isfinite(rets[keep])), ref_dates)
+    ff = report.index[report["policy"] == "ffill"].intersection(keep)
+    if fill and len(ff):
+        live = active_span(out[ff].notna().to_numpy())
+        out[ff] = out[ff].where(~live | out[ff].notna(), 0.0)
+    return out
+
+def write_report(report: pd.DataFrame, outdir: str = OUTDIR) -> str:
+    os.makedirs(outdir, exist_ok=True)
+    path = os.path.join(outdir, REPORT_FILE)
+    report.to_csv(path)
+    return path
+
+def summarize(report: pd.DataFrame):
+    counts = report["policy"].value_counts()
+    print(f"[DQ] include={counts.get('include', 0)} ffill={counts.get('ffill', 0)} "
+          f"exclude={counts.get('exclude', 0)}")
+    for t, row in report[report["policy"] == "exclude"].iterrows():
+        print(f"[DQ] exclude {t}: {row['reason']} (coverage={row['coverage']:.2f}, "
+              f"max_gap={row['max_gap']}, stale_max_run={row['stale_max_run']})")
+    flagged = report[(report["outliers"] > 0) | (report["nonpositive"] > 0)]
+    for t, row in flagged.iterrows():
+        print(f"[DQ] {t}: {row['outliers']} outlier returns (max |z|={row['max_abs_z']:.1f}), "
+              f"{row['nonpositive']} non-positive prints")
+
+def main():
+    from compute_cov import load_tickers
+    tickers = [a.upper() for a in sys.argv[1:]] or load_tickers()
+    prices, _ = returns_store.update(get_client(), tickers)
+    report, ref_dates = scan(prices.reindex(columns=tickers))
+    path = write_report(report)
+    summarize(report)
+    print(f"[OK] Scanned {prices.shape[0]} dates x {len(tickers)} tickers "
+          f"({len(ref_dates)} reference dates); report: {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# db.py
+import os
+from functools import lru_cache
+
+PAGE_SIZE = 1000        # matches [api] max_rows in supabase/config.toml
+IN_BATCH = 200          # values per .in_() filter, so GET URLs stay well under gateway limits
+
+@lru_cache(maxsize=None)
+def get_client():
+    """One Supabase client per process, shared by every stage that runs in it."""
+    from supabase import create_client      # heavy import; only paid by commands that touch the DB
+    from dotenv import load_dotenv
+    load_dotenv()
+    url = os.environ["SUPABASE_URL"]
+    key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or os.environ["SUPABASE_ANON_KEY"]
+    return create_client(url, key)
+
+@lru_cache(maxsize=None)
+def get_session():
+    """Shared requests.Session (keep-alive connection pool) for vendor HTTP calls."""
+    import requests
+    session = requests.Session()
+    session.headers.update({"Accept": "application/json"})
+    return session
+
+def fetch_all(make_query, page_size: int = PAGE_SIZE) -> list:
+    """
+    Page through a PostgREST select. make_query() must return a fresh, ordered
+    query builder each call (builders are not reusable once executed).
+    """
+    rows, start = [], 0
+    while True:
+        r = make_query().range(start, start + page_size - 1).execute()
+        rows.extend(r.data)
+        if len(r.data) < page_size:
+            return rows
+        start += page_size
+
+def in_batches(values, size: int = IN_BATCH) -> list:
+    """Sorted values split into lists of at most `size`, one per .in_() query."""
+    values = sorted(values)
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+def upsert_rows(sb, table: str, rows: list, on_conflict: str, chunk: int = PAGE_SIZE) -> int:
+    total = 0
+    for i in range(0, len(rows), chunk):
+        sb.table(table).upsert(rows[i:i+chunk], on_conflict=on_conflict).execute()
+        total += len(rows[i:i+chunk])
+    return total
@@ -0,0 +1,202 @@
+# exposures.py
+import sys, json, datetime as dt
+import numpy as np
+import pandas as pd
+
+import returns_store
+from compute_cov import load_tickers
+from db import get_client, fetch_all, upsert_rows, in_batches
+from signals import fetch_factor_returns
+
+# --------- Config ---------
+METHOD = "ols"                    # "ols" (rolling window) or "ewma" (exponentially weighted)
+WINDOW = 252                      # observations in the rolling OLS window
+HALFLIFE = 63                     # EWMA half-life in observations
+MIN_OBS = 60                      # fewer observations than this -> no estimate
+RIDGE = 1e-10                     # tiny diagonal load so near-singular windows still solve
+LOOKBACK_DAYS = 400               # calendar days re-read before the last stored exposure date
+HISTORY_DAYS = 3 * 365            # first run depth
+CHUNK_DATES = 64                  # dates per moments / solve / upsert chunk (bounds peak memory)
+# Each row of `factors` is matched to the factor_series slug with the same name;
+# its returns come from factor_values levels.
+# --------------------------
+
+def json_rows(df: pd.DataFrame) -> list:
+    return json.loads(df.to_json(orient="records"))
+
+def design(y: np.ndarray, x: np.ndarray):
+    """
+    Per-date regressors z = [1, x_1..x_K] and a T x N mask of usable
+    (ticker, date) pairs (return present and every factor present).
+    """
+    z = np.column_stack([np.ones(len(x)), np.nan_to_num(x)])
+    m = ~np.isnan(y) & ~np.isnan(x).any(axis=1)[:, None]
+    return z, m, np.where(m, np.nan_to_num(y), 0.0)
+
+def moment_terms(z: np.ndarray, m: np.ndarray, y0: np.ndarray, a: int, b: int):
+    """Per-date X'X, X'y and count terms for rows a..b-1; rows before 0 are zero."""
+    N, K1 = m.shape[1], z.shape[1]
+    xx, xy, n = np.zeros((b - a, N, K1, K1)), np.zeros((b - a, N, K1)), np.zeros((b - a, N))
+    s = max(a, 0)
+    if s < b:
+        mf = m[s:b].astype(float)
+        xx[s - a:] = mf[:, :, None, None] * (z[s:b, :, None] * z[s:b, None, :])[:, None]
+        xy[s - a:] = y0[s:b, :, None] * z[s:b, None, :]
+        n[s - a:] = mf
+    return xx, xy, n
+
+def ols_moments(y: np.ndarray, x: np.ndarray, start: int, window: int = WINDOW, chunk: int = CHUNK_DATES):
+    """
+    Rolling X'X (c x N x K1 x K1), X'y (c x N x K1) and counts (c x N) for rows
+    start..T-1, yielded as (rows, sxx, sxy, n) chunks. The window sum is filled
+    once up to start-1; after that each date adds its cross-products and
+    subtracts those `window` rows back (a running prefix sum), so each new date
+    is an O(K^2 N) update and memory is bounded by one chunk.
+    """
+    z, m, y0 = design(y, x)
+    N, K1 = y.shape[1], z.shape[1]
+    state = [np.zeros((N, K1, K1)), np.zeros((N, K1)), np.zeros(N)]
+    for a in range(start - window, start, chunk):
+        for S, term in zip(state, moment_terms(z, m, y0, a, min(a + chunk, start))):
+            S += term.sum(axis=0)
+    for a in range(start, len(y), chunk):
+        b = min(a + chunk, len(y))
+        add, drop = moment_terms(z, m, y0, a, b), moment_terms(z, m, y0, a - window, b - window)
+        out = [S + np.cumsum(p - q, axis=0) for S, p, q in zip(state, add, drop)]
+        state = [o[-1].copy() for o in out]
+        yield (np.arange(a, b), *out)
+
+def ewma_moments(y: np.ndarray, x: np.ndarray, start: int, halflife: float = HALFLIFE, chunk: int = CHUNK_DATES):
+    """
+    Same chunks as ols_moments, with S_t = lam * S_{t-1} + m_t z_t z_t' (one
+    O(K^2 N) step per date). Only the running state and the current chunk are kept.
+    """
+    z, m, y0 = design(y, x)
+    lam = 0.5 ** (1.0 / halflife)
+    N, K1 = y.shape[1], z.shape[1]
+    cur_xx, cur_xy, cur_n = np.zeros((N, K1, K1)), np.zeros((N, K1)), np.zeros(N)
+    sxx, sxy, cnt = None, None, None
+    for t in range(len(y)):
+        cur_xx = lam * cur_xx + m[t].astype(float)[:, None, None] * (z[t][:, None] * z[t][None, :])
+        cur_xy = lam * cur_xy + y0[t][:, None] * z[t]
+        cur_n = cur_n + m[t]              # unweighted count, so MIN_OBS means the same thing for both methods
+        if t < start:
+            continue
+        k = (t - start) % chunk
+        if k == 0:
+            c = min(chunk, len(y) - t)
+            sxx, sxy, cnt = np.empty((c, N, K1, K1)), np.empty((c, N, K1)), np.empty((c, N))
+        sxx[k], sxy[k], cnt[k] = cur_xx, cur_xy, cur_n
+        if k == len(cnt) - 1:
+            yield np.arange(t - k, t + 1), sxx, sxy, cnt
+
+def solve_betas(sxx: np.ndarray, sxy: np.ndarray, n: np.ndarray, min_obs: int = MIN_OBS) -> np.ndarray:
+    """Batched normal equations for every (date, ticker); NaN where too few observations."""
+    K1 = sxx.shape[-1]
+    A = sxx + RIDGE * np.eye(K1)
+    beta = np.linalg.solve(A, sxy[..., None])[..., 0]
+    beta[n < min_obs] = np.nan
+    return beta[..., 1:]                                               # drop the intercept
+
+def load_factors(sb, names=None) -> pd.DataFrame:
+    def q():
+        b = sb.table("factors").select("factor_id, name")
+        if names:
+            b = b.in_("name", names)
+        return b.order("name")
+    return pd.DataFrame(fetch_all(q), columns=["factor_id", "name"])
+
+def last_exposure_dts(sb, factor_ids, tickers) -> pd.Series:
+    """
+    {ticker: last date whose exposures are stored}, NaT where the ticker must be
+    built from history. Betas come from one joint regression on every factor, so
+    a factor with no rows yet sends every ticker back to history. Otherwise
+    tickers with rows on the latest stored date are current, and only the
+    rest are looked up one by one (new tickers come back NaT).
+    """
+    last_f = []
+    for fid in factor_ids:
+        r = (sb.table("instrument_factor_exposures").select("dt").eq("factor_id", fid)
+               .order("dt", desc=True).limit(1).execute())
+        last_f.append(pd.Timestamp(r.data[0]["dt"]) if r.data else pd.NaT)
+    last = pd.Series(pd.NaT, index=tickers, dtype="datetime64[ns]")
+    if not last_f or pd.isna(last_f).any():
+        return last
+
+    latest = max(last_f)
+    for batch in in_batches(tickers):
+        rows = fetch_all(lambda: (
+            sb.table("instrument_factor_exposures").select("ticker")
+              .eq("dt", latest.strftime("%Y-%m-%d"))
+              .in_("factor_id", factor_ids)
+              .in_("ticker", batch)
+              .order("ticker")
+        ))
+        last[last.index.isin([r["ticker"] for r in rows])] = latest
+    for t in last.index[last.isna()]:
+        r = (sb.table("instrument_factor_exposures").select("dt").eq("ticker", t).in_("factor_id", factor_ids)
+               .order("dt", desc=True).limit(1).execute())
+        if r.data:
+            last[t] = pd.Timestamp(r.data[0]["dt"])
+    return last
+
+def run(sb, names=None, tickers=None, method: str = METHOD, full: bool = False) -> int:
+    factors = load_factors(sb, names)
+    if factors.empty:
+        print("[WARN] No factors found.")
+        return 0
+    tickers = [t.upper() for t in (tickers or load_tickers())]
+    if method not in ("ols", "ewma"):
+        raise ValueError(f"Unknown method: {method}")
+    moments = ewma_moments if method == "ewma" else ols_moments
+    ids = factors["factor_id"].tolist()
+    last = pd.Series(pd.NaT, index=tickers, dtype="datetime64[ns]") if full else last_exposure_dts(sb, ids, tickers)
+    history = pd.Timestamp(dt.date.today() - dt.timedelta(days=HISTORY_DAYS))
+    starts = (last - pd.Timedelta(days=LOOKBACK_DAYS)).fillna(history)
+
+    x_all = fetch_factor_returns(sb, factors["name"].tolist(), starts.min().date())
+    missing = [f for f in x_all.columns if x_all[f].isna().all()]
+    if missing:
+        print(f"[WARN] No factor_values levels for: {missing} (skipped)")
+        keep = ~factors["name"].isin(missing)
+        factors, x_all = factors[keep], x_all.drop(columns=missing)
+        if not full and not factors.empty:
+            # a skipped factor never gets rows, so it must not count as new
+            last = last_exposure_dts(sb, factors["factor_id"].tolist(), tickers)
+            starts = (last - pd.Timedelta(days=LOOKBACK_DAYS)).fillna(history)
+    if factors.empty:
+        return 0
+    _, rets = returns_store.update(sb, tickers)
+
+    # tickers sharing a last stored date share one pass; new ones start from history
+    n_rows, n_dates = 0, 0
+    for _, grp in last.groupby(last.dt.strftime("%Y-%m-%d").fillna("")):
+        ref, cols = grp.iloc[0], grp.index.tolist()
+        y = rets.reindex(columns=cols).loc[starts[cols].min():]
+        dates = y.index.intersection(x_all.index)          # a regression date needs the factor returns
+        yv, xv = y.reindex(dates).to_numpy(dtype=float), x_all.reindex(dates).to_numpy(dtype=float)
+        start = int(dates.searchsorted(ref, side="right")) if pd.notna(ref) else 0
+        n_dates = max(n_dates, len(dates) - start)
+        # solve and upsert chunk by chunk so the R x N x K1 x K1 moments never exist at once
+        for rows, sxx, sxy, n in moments(yv, xv, start):
+            beta = solve_betas(sxx, sxy, n)                # chunk x N x K
+            t_idx, n_idx, k_idx = np.nonzero(np.isfinite(beta))
+            df = pd.DataFrame({
+                "ticker": np.asarray(cols)[n_idx],
+                "factor_id": factors["factor_id"].to_numpy()[k_idx],
+                "dt": dates[rows][t_idx].strftime("%Y-%m-%d"),
+                "exposure": beta[t_idx, n_idx, k_idx],
+            })
+            n_rows += upsert_rows(sb, "instrument_factor_exposures", json_rows(df), on_conflict="ticker,factor_id,dt")
+    print(f"[OK] instrument_factor_exposures: {n_rows} rows ({method}, {len(tickers)} tickers x "
+          f"{len(factors)} factors, up to {n_dates} dates)")
+    return n_rows
+
+def main():
+    full = "--full" in sys.argv
+    method = "ewma" if "--ewma" in sys.argv else METHOD
+    names = [a for a in sys.argv[1:] if not a.startswith("--")] or None
+    run(get_client(), names, method=method, full=full)
+
+if __name__ == "__main__":
+    main()
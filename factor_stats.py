@@ -0,0 +1,124 @@
+# factor_stats.py
+import sys, json, datetime as dt
+import numpy as np
+import pandas as pd
+
+from db import get_client, fetch_all, upsert_rows
+
+# --------- Config ---------
+WINDOW = 252                      # rolling window (observations) for mean / std / z
+HORIZONS = (1, 20, 60, 252)       # r_1d, r_20d, r_60d, r_252d
+LOOKBACK_DAYS = 400               # calendar days of history re-read before the first pending date
+STAT_COLS = [f"r_{h}d" for h in HORIZONS] + [
+    "mean_r1d_252", "std_r1d_252", "z_r1d_252",
+    "mean_lvl_252", "std_lvl_252", "z_lvl_252",
+]
+# --------------------------
+
+def json_rows(df: pd.DataFrame) -> list:
+    return json.loads(df.to_json(orient="records"))
+
+def stack_levels(long: pd.DataFrame):
+    """
+    Long (slug, dt, level) -> (levels, dates): two O x S matrices aligned on
+    observation number counted from each slug's latest row. Shifts and rolling
+    windows on them run in each series' own observation space, so slugs with
+    different calendars share one matrix without forward-filling.
+    """
+    long = long.sort_values(["slug", "dt"])
+    pos = long.groupby("slug").cumcount(ascending=False)
+    long = long.assign(obs=int(pos.max()) - pos)
+    levels = long.pivot(index="obs", columns="slug", values="level").astype(float)
+    dates = long.pivot(index="obs", columns="slug", values="dt")
+    return levels, dates
+
+def compute_stats(levels: pd.DataFrame, window: int = WINDOW) -> dict:
+    """All factor_values stat columns for every slug at once; {column: O x S frame}."""
+    out = {f"r_{h}d": levels / levels.shift(h) - 1.0 for h in HORIZONS}
+    for name, x in (("r1d", out["r_1d"]), ("lvl", levels)):
+        roll = x.rolling(window, min_periods=window)
+        mean, std = roll.mean(), roll.std()
+        out[f"mean_{name}_{window}"] = mean
+        out[f"std_{name}_{window}"] = std
+        out[f"z_{name}_{window}"] = (x - mean) / std.where(std > 0)
+    return out
+
+def unstack_stats(stats: dict, dates: pd.DataFrame) -> pd.DataFrame:
+    """Back to long (slug, dt, <stat cols>) rows, one per real observation."""
+    mask = dates.notna().to_numpy()
+    slugs = np.broadcast_to(dates.columns.to_numpy(), dates.shape)[mask]
+    df = pd.DataFrame({"slug": slugs, "dt": dates.to_numpy()[mask]})
+    for col in STAT_COLS:
+        df[col] = stats[col].to_numpy()[mask]
+    return df
+
+def fetch_pending(sb, slugs) -> pd.Series:
+    """
+    {slug: first dt with a level but no r_1d}. Every row gets r_1d here except a
+    series' first observation (no prior level), which is always the earliest
+    such row, so each slug's earliest one is dropped rather than treated as pending.
+    """
+    rows = fetch_all(lambda: (
+        sb.table("factor_values")
+          .select("slug, dt")
+          .in_("slug", slugs)
+          .not_.is_("level", "null")
+          .is_("r_1d", "null")
+          .order("slug").order("dt")
+    ))
+    df = pd.DataFrame(rows, columns=["slug", "dt"])
+    df["dt"] = pd.to_datetime(df["dt"])
+    df = df[df.groupby("slug").cumcount() > 0]
+    return df.groupby("slug")["dt"].min()
+
+def fetch_levels(sb, slugs, since: dt.date) -> pd.DataFrame:
+    rows = fetch_all(lambda: (
+        sb.table("factor_values")
+          .select("slug, dt, level")
+          .in_("slug", slugs)
+          .gte("dt", since.strftime("%Y-%m-%d"))
+          .not_.is_("level", "null")
+          .order("slug").order("dt")
+    ))
+    df = pd.DataFrame(rows, columns=["slug", "dt", "level"])
+    df["dt"] = pd.to_datetime(df["dt"])
+    df["level"] = pd.to_numeric(df["level"], errors="coerce")
+    return df.dropna(subset=["level"])
+
+def run(sb, slugs=None, full: bool = False) -> int:
+    if slugs is None:
+        slugs = [r["slug"] for r in fetch_all(lambda: sb.table("factor_series").select("slug").order("slug"))]
+    if not slugs:
+        print("[WARN] No factor_series found.")
+        return 0
+
+    if full:
+        pending = pd.Series(pd.Timestamp("1900-01-01"), index=slugs)
+    else:
+        pending = fetch_pending(sb, slugs)
+        if pending.empty:
+            print("[SKIP] factor_values stats already up to date.")
+            return 0
+
+    since = (pending.min() - pd.Timedelta(days=LOOKBACK_DAYS)).date()
+    long = fetch_levels(sb, pending.index.tolist(), since)
+    if long.empty:
+        return 0
+
+    levels, dates = stack_levels(long)
+    df = unstack_stats(compute_stats(levels), dates)
+    # only rewrite rows from each slug's first pending date on; earlier rows were lookback
+    df = df[df["dt"] >= df["slug"].map(pending)]
+    df["dt"] = df["dt"].dt.strftime("%Y-%m-%d")
+    n = upsert_rows(sb, "factor_values", json_rows(df[["slug", "dt"] + STAT_COLS]), on_conflict="slug,dt")
+    print(f"[OK] factor_values: upserted stats for {n} rows over {df['slug'].nunique()} series "
+          f"({levels.shape[0]} obs x {levels.shape[1]} series matrix)")
+    return n
+
+def main():
+    full = "--full" in sys.argv
+    slugs = [a for a in sys.argv[1:] if not a.startswith("--")] or None
+    run(get_client(), slugs, full=full)
+
+if __name__ == "__main__":
+    main()
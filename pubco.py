@@ -0,0 +1,96 @@
+# pubco.py
+"""
+Single entry point for the pipeline:
+
+    pubco update [TICKER ...]   Tiingo → prices_daily
+    pubco cov                   covariance / correlation outputs (compute_cov.py)
+    pubco erc                   ERC and HRP portfolios (compute_erc.py, compute_hrp.py)
+    pubco viz                   charts (visualize_erc.py)
+    pubco run                   update → cov → erc → viz in one process
+
+Stage modules are imported inside their command, so `pubco erc` never loads
+supabase and `pubco cov` never loads matplotlib. Stages chained by `run`
+share the one Supabase client and HTTP session cached in db.py.
+"""
+import sys, time, argparse
+
+def cmd_update(args):
+    import update_prices_tiingo
+    update_prices_tiingo.run([t.upper() for t in args.tickers] or None)
+
+def cmd_cov(args):
+    import compute_cov
+    compute_cov.main()
+
+def cmd_erc(args):
+    import compute_erc, compute_hrp
+    compute_erc.main()
+    if not args.no_hrp:
+        compute_hrp.main()
+
+def cmd_viz(args):
+    import visualize_erc
+    visualize_erc.main(force=args.force,
+                       formats=visualize_erc.FORMATS + (["svg"] if args.svg else []),
+                       emit_json=visualize_erc.EMIT_JSON or args.json)
+
+def cmd_run(args):
+    stages = [("update", cmd_update), ("cov", cmd_cov), ("erc", cmd_erc), ("viz", cmd_viz)]
+    for name, fn in stages:
+        if name in args.skip:
+            print(f"[INFO] Skipping {name}")
+            continue
+        if name == "erc":
+            import compute_erc
+            if compute_erc.blockwise_only():
+                # blockwise cov writes .npy tiles only; ERC / HRP / charts need the dense CSVs
+                print("[WARN] Covariance was built in blockwise mode (no dense CSVs); stopping before erc and viz.")
+                return
+        timed(name, fn, args)
+
+def timed(name, fn, args):
+    t0 = time.perf_counter()
+    fn(args)
+    print(f"[INFO] {name} finished in {time.perf_counter() - t0:.1f}s")
+
+def add_viz_flags(p):
+    p.add_argument("--force", action="store_true", help="re-render charts even if their inputs are unchanged")
+    p.add_argument("--svg", action="store_true", help="also write vector (.svg) charts")
+    p.add_argument("--json", action="store_true", help="also write compact .json chart data")
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog="pubco", description="PubCo price / risk pipeline")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    s = sub.add_parser("update", help="pull daily prices from Tiingo into prices_daily")
+    s.add_argument("tickers", nargs="*", help="only these tickers (default: every row in 'tickers')")
+    s.set_defaults(func=cmd_update)
+
+    s = sub.add_parser("cov", help="build covariance / correlation files in outputs/")
+    s.set_defaults(func=cmd_cov)
+
+    s = sub.add_parser("erc", help="solve ERC (and HRP) portfolios from outputs/ covariances")
+    s.add_argument("--no-hrp", action="store_true", help="skip the HRP panel")
+    s.set_defaults(func=cmd_erc)
+
+    s = sub.add_parser("viz", help="render charts from the ERC outputs")
+    add_viz_flags(s)
+    s.set_defaults(func=cmd_viz)
+
+    s = sub.add_parser("run", help="update → cov → erc → viz in one process")
+    s.add_argument("--skip", nargs="*", default=[], choices=["update", "cov", "erc", "viz"],
+                   help="stages to leave out")
+    s.add_argument("--no-hrp", action="store_true", help="skip the HRP panel")
+    add_viz_flags(s)
+    s.set_defaults(func=cmd_run, tickers=[])
+    return p
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "run":
+        args.func(args)
+    else:
+        timed(args.command, args.func, args)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,160 @@
+# returns_store.py
+import json, sys, datetime as dt
+from pathlib import Path
+from typing import Optional
+import numpy as np
+import pandas as pd
+
+from db import get_client, fetch_all, in_batches
+
+# --------- Config ---------
+STORE_DIR = Path(".cache") / "returns"
+PRICES_FILE = STORE_DIR / "prices_adj_close.pkl"      # wide: index=dt, columns=tickers, NaN = no print
+RETURNS_FILE = STORE_DIR / "returns_log_daily.pkl"    # same shape as prices
+META_FILE = STORE_DIR / "meta.json"                   # {"watermarks": {ticker: max updated_at seen}, "history_from": {ticker: first dt fetched}}
+HISTORY_YEARS = 5                                     # default backfill depth for tickers new to the store
+# --------------------------
+
+def log_returns(prices: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per-ticker log return against that ticker's previous valid price, so a gap
+    in one name never drops the date for the others. NaN where there is no print.
+    """
+    lp = np.log(prices)
+    return lp - lp.ffill().shift(1)
+
+def load_store():
+    """(prices, returns, meta); empty if the store has not been built."""
+    if not (PRICES_FILE.exists() and RETURNS_FILE.exists() and META_FILE.exists()):
+        return pd.DataFrame(), pd.DataFrame(), {"watermarks": {}, "history_from": {}}
+    meta = json.loads(META_FILE.read_text())
+    meta.setdefault("watermarks", {})
+    meta.setdefault("history_from", {})
+    return pd.read_pickle(PRICES_FILE), pd.read_pickle(RETURNS_FILE), meta
+
+def save_store(prices: pd.DataFrame, rets: pd.DataFrame, meta: dict):
+    STORE_DIR.mkdir(parents=True, exist_ok=True)
+    prices.to_pickle(PRICES_FILE)
+    rets.to_pickle(RETURNS_FILE)
+    META_FILE.write_text(json.dumps(meta))
+
+def fetch_rows(sb, tickers, since_dt: Optional[dt.date] = None, updated_after: Optional[str] = None,
+               until_dt: Optional[dt.date] = None) -> pd.DataFrame:
+    """
+    Long rows (ticker, dt, adj_close, updated_at) from prices_daily, paged and
+    batched over tickers; until_dt is exclusive.
+    """
+    def q(batch):
+        b = (sb.table("prices_daily")
+               .select("ticker, dt, adj_close, updated_at")
+               .in_("ticker", batch))
+        if since_dt is not None:
+            b = b.gte("dt", since_dt.strftime("%Y-%m-%d"))
+        if until_dt is not None:
+            b = b.lt("dt", until_dt.strftime("%Y-%m-%d"))
+        if updated_after:
+            b = b.gt("updated_at", updated_after)
+        return b.order("ticker").order("dt")
+    rows = [r for batch in in_batches(tickers) for r in fetch_all(lambda: q(batch))]
+    df = pd.DataFrame(rows, columns=["ticker", "dt", "adj_close", "updated_at"])
+    df["dt"] = pd.to_datetime(df["dt"])
+    df["adj_close"] = pd.to_numeric(df["adj_close"], errors="coerce")
+    return df
+
+def update(sb, tickers, since_dt: Optional[dt.date] = None) -> tuple:
+    """
+    Bring the store up to date with prices_daily and return (prices, returns).
+    Only rows whose updated_at moved past the stored watermark are pulled; each
+    touched ticker has its returns recomputed from the last valid price before
+    its earliest changed date, which covers both appended days and
+    re-adjusted history. since_dt deepens the history beyond HISTORY_YEARS;
+    tickers already stored from a later date are backfilled once.
+    """
+    tickers = [t.upper() for t in tickers]
+    prices, rets, meta = load_store()
+    watermarks, history = meta["watermarks"], meta["history_from"]
+    since = dt.date.today() - dt.timedelta(days=int(HISTORY_YEARS * 365))
+    if since_dt is not None:
+        since = min(since, pd.Timestamp(since_dt).date())
+
+    new = [t for t in tickers if t not in prices.columns or t not in watermarks]
+    old = [t for t in tickers if t not in new]
+    # stores built before history_from was tracked start at each ticker's first print
+    for t in old:
+        if t not in history:
+            first = prices[t].first_valid_index()
+            history[t] = (first.date() if first is not None else since).strftime("%Y-%m-%d")
+    short = [t for t in old if history[t] > since.strftime("%Y-%m-%d")]
+    frames = []
+    if new:
+        frames.append(fetch_rows(sb, new, since_dt=since))
+    if old:
+        # one query from the oldest watermark, then drop rows each ticker has already seen
+        rows = fetch_rows(sb, old, updated_after=min(watermarks[t] for t in old) or None)
+        seen = rows["ticker"].map(watermarks).fillna("")
+        frames.append(rows[rows["updated_at"].fillna("") > seen])
+    if short:
+        rows = fetch_rows(sb, short, since_dt=since,
+                          until_dt=pd.Timestamp(max(history[t] for t in short)).date())
+        frames.append(rows[rows["dt"] < pd.to_datetime(rows["ticker"].map(history))])
+        print(f"[INFO] Returns store: backfilling {len(short)} tickers to {since}")
+    for t in new + short:
+        history[t] = since.strftime("%Y-%m-%d")
+    changed = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if changed.empty:
+        if short and not prices.empty:
+            save_store(prices, rets, meta)              # remember the depth so the backfill is not retried
+        return prices, rets
+
+    # 1) merge changed prints into the wide price panel
+    wide = changed.pivot_table(index="dt", columns="ticker", values="adj_close", aggfunc="last")
+    prices = prices.combine_first(wide) if not prices.empty else wide
+    prices.update(wide)
+    prices = prices.sort_index()
+    rets = rets.reindex(index=prices.index, columns=prices.columns)
+
+    # 2) recompute returns only from each touched ticker's first affected row
+    first_changed = changed.groupby("ticker")["dt"].min()
+    cols = first_changed.index.tolist()
+    pos = prices.index.get_indexer(first_changed.values)
+    valid = prices[cols].notna().to_numpy()
+    # anchor = last valid print before the first change (its own return is untouched);
+    # every row after it is rebuilt, and the block starts early enough to contain it
+    anchors = np.array([
+        (np.flatnonzero(valid[:p, k])[-1] if valid[:p, k].any() else p - 1)
+        for k, p in enumerate(pos)
+    ])
+    lo = max(int(anchors.min()), 0)
+    block = log_returns(prices[cols].iloc[lo:])
+    rows = np.arange(lo, len(prices))[:, None]
+    keep = rows > anchors[None, :]
+    rets.loc[prices.index[lo:], cols] = np.where(keep, block.to_numpy(), rets[cols].iloc[lo:].to_numpy())
+
+    latest = changed.dropna(subset=["updated_at"]).groupby("ticker")["updated_at"].max()
+    for t, ts in latest.items():
+        watermarks[t] = max(watermarks.get(t, ""), str(ts))
+    save_store(prices, rets, meta)
+    print(f"[INFO] Returns store: {len(changed)} changed rows over {len(cols)} tickers "
+          f"(recomputed from {prices.index[lo].date()})")
+    return prices, rets
+
+def load_returns(tickers=None, start_dt=None, end_dt=None) -> pd.DataFrame:
+    """Slice of the stored log returns; NaN where a ticker has no print that day."""
+    _, rets, _ = load_store()
+    if rets.empty:
+        raise SystemExit("[ERROR] Returns store is empty. Run returns_store.py first.")
+    if tickers is not None:
+        rets = rets.reindex(columns=[t.upper() for t in tickers])
+    return rets.loc[pd.Timestamp(start_dt) if start_dt else None: pd.Timestamp(end_dt) if end_dt else None]
+
+def main():
+    from compute_cov import load_tickers
+    tickers = load_tickers()
+    if len(sys.argv) > 1:
+        tickers = [a.upper() for a in sys.argv[1:]]
+    prices, rets = update(get_client(), tickers)
+    print(f"[OK] Store holds {rets.shape[0]} dates x {rets.shape[1]} tickers "
+          f"(last date {rets.index.max().date() if len(rets) else 'n/a'})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# risk_attribution.py
+from pathlib import Path
+from typing import Optional, Union
+import numpy as np
+import pandas as pd
+
+# -------- Config --------
+OUTDIR = Path("outputs")
+OUT_FILE = OUTDIR / "risk_attribution.csv"
+# ------------------------
+
+def attribute(W: np.ndarray, S: np.ndarray) -> dict:
+    """
+    Closed-form risk attribution for a stack of P portfolios at once.
+    W: P x N weights; S: P x N x N covariances, or one N x N shared by all.
+
+    vol_p = sqrt(w' S w), marginal mrc = S w / vol, component crc = w * mrc
+    (sums to vol), share = crc / vol, diversification ratio = w'sigma / vol.
+    Everything is a batched einsum; nothing loops over portfolios.
+    """
+    W = np.asarray(W, dtype=float)
+    S = np.asarray(S, dtype=float)
+    Sw = np.einsum("ij,pj->pi", S, W) if S.ndim == 2 else np.einsum("pij,pj->pi", S, W)
+    vol = np.sqrt(np.clip(np.einsum("pi,pi->p", W, Sw), 0.0, None))
+    safe = np.where(vol > 0, vol, np.nan)[:, None]
+    mrc = Sw / safe
+    crc = W * mrc
+    sigma = np.sqrt(np.clip(np.diagonal(S, axis1=-2, axis2=-1), 0.0, None))
+    return {
+        "vol": vol,
+        "mrc": mrc,
+        "crc": crc,
+        "share": crc / safe,
+        "diversification_ratio": (W * sigma).sum(axis=1) / safe[:, 0],
+    }
+
+def cluster_onehot(tickers: list, clusters: dict, default: str = "Other"):
+    """(cluster names, N x K 0/1 matrix) so per-cluster sums are one matrix product."""
+    labels = [clusters.get(t, default) for t in tickers]
+    names = sorted(set(labels))
+    G = np.zeros((len(tickers), len(names)))
+    G[np.arange(len(tickers)), [names.index(l) for l in labels]] = 1.0
+    return names, G
+
+def stack_covs(keys: pd.Index, tickers: list, covs: Union[pd.DataFrame, dict]) -> np.ndarray:
+    """One shared N x N matrix, or a P x N x N stack (one cov per weights row)."""
+    if isinstance(covs, pd.DataFrame):
+        return covs.reindex(index=tickers, columns=tickers).to_numpy(dtype=float)
+    return np.stack([covs[k].reindex(index=tickers, columns=tickers).to_numpy(dtype=float) for k in keys])
+
+def attribution_table(weights: pd.DataFrame, covs: Union[pd.DataFrame, dict],
+                      clusters: Optional[dict] = None) -> pd.DataFrame:
+    """
+    weights: one row per portfolio (index = scenario, or (scenario, dt), ...),
+    columns = tickers. covs: one covariance for all rows, or {row key: cov}.
+
+    Returns a tidy long table: the weights index levels, then level
+    ('portfolio' | 'ticker' | 'cluster'), name, metric, value.
+    """
+    tickers = weights.columns.tolist()
+    W = weights.fillna(0.0).to_numpy(dtype=float)
+    a = attribute(W, stack_covs(weights.index, tickers, covs))
+
+    blocks = {("ticker", "weight"): W, ("ticker", "mrc"): a["mrc"],
+              ("ticker", "crc"): a["crc"], ("ticker", "risk_share"): a["share"]}
+    names = {"ticker": tickers, "portfolio": ["portfolio"]}
+    blocks[("portfolio", "vol")] = a["vol"][:, None]
+    blocks[("portfolio", "diversification_ratio")] = a["diversification_ratio"][:, None]
+    if clusters is not None:
+        names["cluster"], G = cluster_onehot(tickers, clusters)
+        blocks[("cluster", "weight")] = W @ G
+        blocks[("cluster", "crc")] = a["crc"] @ G
+        blocks[("cluster", "risk_share")] = a["share"] @ G
+
+    idx = weights.index.to_frame(index=False)
+    frames = []
+    for (level, metric), M in blocks.items():
+        P, K = M.shape
+        df = idx.loc[np.repeat(np.arange(P), K)].reset_index(drop=True)
+        df["level"] = level
+        df["name"] = np.tile(names[level], P)
+        df["metric"] = metric
+        df["value"] = M.ravel()
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
+def write_table(table: pd.DataFrame, path: Path = OUT_FILE) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    table.to_csv(path, index=False)
+    return path
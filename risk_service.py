@@ -0,0 +1,161 @@
+# risk_service.py
+import json, sys, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import numpy as np
+
+from compute_erc import load_cov, erc_optimize, RISK_SHARE_CAP, WINSOR_FILE
+
+# -------- Config --------
+OUTDIR = Path("outputs")
+HOST = "127.0.0.1"
+PORT = 8765
+REFRESH_SECS = 5.0          # how often to check the covariance files for changes
+COV_FILES = {
+    "sample":      OUTDIR / "cov_annual.csv",
+    "ledoit_wolf": OUTDIR / "cov_annual_ledoit_wolf.csv",
+    "ewma":        OUTDIR / "cov_annual_ewma_hl21.csv",
+    "winsor_lw":   WINSOR_FILE,                              # optional (name follows compute_cov WINSOR_SIGMA)
+    "mcd":         OUTDIR / "cov_annual_mcd.csv",            # optional
+    "huber":       OUTDIR / "cov_annual_huber.csv",          # optional
+    "pairwise":    OUTDIR / "cov_annual_pairwise.csv",       # optional
+}
+DEFAULT_SCENARIO = "ledoit_wolf"
+# ------------------------
+
+class CovSet:
+    """One loaded covariance matrix plus a ticker -> row lookup."""
+    def __init__(self, path: Path):
+        cov = load_cov(path)
+        self.mtime = path.stat().st_mtime
+        self.cov = cov
+        self.S = np.ascontiguousarray(cov.values, dtype=float)
+        self.tickers = cov.index.tolist()
+        self.pos = {t: i for i, t in enumerate(self.tickers)}
+
+    def index(self, tickers) -> np.ndarray:
+        missing = [t for t in tickers if t not in self.pos]
+        if missing:
+            raise KeyError(f"unknown tickers: {missing}")
+        return np.fromiter((self.pos[t] for t in tickers), dtype=int, count=len(tickers))
+
+class Store:
+    """
+    Holds every scenario's matrix in memory. refresh() reloads only files whose
+    mtime moved and swaps the dict in one assignment, so readers never lock.
+    """
+    def __init__(self, files: dict):
+        self.files = files
+        self.sets = {}
+        self.refresh()
+
+    def refresh(self):
+        sets = dict(self.sets)
+        for name, path in self.files.items():
+            if not path.exists():
+                sets.pop(name, None)
+                continue
+            cur = sets.get(name)
+            if cur is None or path.stat().st_mtime != cur.mtime:
+                try:
+                    sets[name] = CovSet(path)
+                    print(f"[INFO] Loaded {name}: {path} ({len(sets[name].tickers)} tickers)")
+                except Exception as e:
+                    print(f"[WARN] Could not load {path}: {e}", file=sys.stderr)
+        self.sets = sets
+
+    def watch(self, every: float = REFRESH_SECS):
+        def loop():
+            while True:
+                time.sleep(every)
+                self.refresh()
+        threading.Thread(target=loop, daemon=True).start()
+
+    def get(self, name: str) -> CovSet:
+        if name not in self.sets:
+            raise KeyError(f"unknown or missing scenario: {name}")
+        return self.sets[name]
+
+def risk_report(cs: CovSet, weights: dict) -> dict:
+    """Portfolio vol, marginal and component risk for {ticker: weight} (subset allowed)."""
+    tickers = list(weights)
+    idx = cs.index(tickers)
+    w = np.fromiter((float(weights[t]) for t in tickers), dtype=float, count=len(tickers))
+    S = cs.S[np.ix_(idx, idx)]
+    Sw = S @ w
+    var = float(w @ Sw)
+    vol = float(np.sqrt(var)) if var > 0 else 0.0
+    mrc = Sw / (vol if vol > 0 else 1e-16)         # d vol / d w_i
+    rc = w * mrc                                    # sums to vol
+    return {
+        "portfolio_vol": vol,
+        "marginal_risk": dict(zip(tickers, mrc.tolist())),
+        "risk_contrib_vol": dict(zip(tickers, rc.tolist())),
+        "risk_share": dict(zip(tickers, (rc / (vol if vol > 0 else 1e-16)).tolist())),
+    }
+
+def erc_report(cs: CovSet, tickers=None, cap_share=RISK_SHARE_CAP) -> dict:
+    cov = cs.cov
+    if tickers:
+        idx = cs.index(tickers)
+        cov = cov.iloc[idx, idx]
+    w, shares, vol, rc_vol = erc_optimize(cov, cap_share=cap_share)
+    return {
+        "portfolio_vol": vol,
+        "weights": w.to_dict(),
+        "risk_share": shares.to_dict(),
+        "risk_contrib_vol": rc_vol.to_dict(),
+    }
+
+def make_handler(store: Store):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code: int, payload: dict):
+            body = json.dumps(payload).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/scenarios":
+                self._send(200, {name: cs.tickers for name, cs in store.sets.items()})
+            else:
+                self._send(404, {"error": f"no route {self.path}"})
+
+        def do_POST(self):
+            try:
+                n = int(self.headers.get("Content-Length") or 0)
+                req = json.loads(self.rfile.read(n) or b"{}")
+                cs = store.get(req.get("scenario", DEFAULT_SCENARIO))
+                if self.path == "/risk":
+                    self._send(200, risk_report(cs, req["weights"]))
+                elif self.path == "/erc":
+                    self._send(200, erc_report(cs, req.get("tickers"), req.get("cap_share", RISK_SHARE_CAP)))
+                else:
+                    self._send(404, {"error": f"no route {self.path}"})
+            except (KeyError, ValueError, TypeError) as e:
+                self._send(400, {"error": str(e.args[0]) if e.args else repr(e)})
+
+        def log_message(self, fmt, *args):
+            pass                                    # keep the hot path quiet
+
+    return Handler
+
+def main():
+    store = Store(COV_FILES)
+    if not store.sets:
+        raise SystemExit("[ERROR] No covariance files found in outputs/. Run compute_cov.py first.")
+    store.watch()
+    server = ThreadingHTTPServer((HOST, PORT), make_handler(store))
+    print(f"[INFO] Risk service on http://{HOST}:{PORT} "
+          f"(POST /risk, POST /erc, GET /scenarios); scenarios: {', '.join(store.sets)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,9 @@
 import os, datetime as dt, json, sys
 from typing import List
 import pandas as pd
-import yfinance as yf
 from tenacity import retry, wait_exponential, stop_after_attempt
-from supabase import create_client
-from dotenv import load_dotenv
+
+from db import get_client
 
 # ---------- Config ----------
 HISTORY_YEARS = 5           # how many years to backfill
@@ -27,18 +26,13 @@ def json_rows(df: pd.DataFrame) -> list:
     # Convert DataFrame to JSON-safe list[dict] (NaN->null, numpy types->native)
     return json.loads(df.to_json(orient="records"))
 
-# ---------- Supabase client ----------
-load_dotenv()
-SUPABASE_URL = os.environ["SUPABASE_URL"]
-SUPABASE_KEY = os.environ["SUPABASE_ANON_KEY"]  # use Service Role key
-sb = create_client(SUPABASE_URL, SUPABASE_KEY)
-
 # ---------- Date range ----------
 END = dt.date.today()
 START = END - dt.timedelta(days=HISTORY_YEARS * 365)
 
 @retry(wait=wait_exponential(multiplier=1, min=2, max=30), stop=stop_after_attempt(5))
 def fetch_history(ticker: str) -> pd.DataFrame:
+    import yfinance as yf
     df = yf.download(
         ticker,
         start=START,
@@ -81,6 +75,7 @@ def upsert_df(df: pd.DataFrame) -> int:
     rows = json_rows(df)
     total = 0
     chunk = 1000
+    sb = get_client()
     for i in range(0, len(rows), chunk):
         sb.table("prices_daily").upsert(rows[i:i+chunk], on_conflict="ticker,dt").execute()
         total += len(rows[i:i+chunk])
@@ -0,0 +1,150 @@
+# signals.py
+import sys, json, uuid, datetime as dt
+import numpy as np
+import pandas as pd
+
+import returns_store
+from compute_cov import load_tickers
+from db import get_client, fetch_all, upsert_rows
+
+# --------- Config ---------
+FACTOR_SLUGS = []                 # default factor_series slugs to run against (or pass on the command line)
+BETA_WINDOW = 60                  # observations in the rolling hedge-ratio regression
+Z_WINDOW = 60                     # observations in the rolling spread mean / std
+MIN_OBS = 40                      # fewer paired observations than this -> no signal
+ENTRY_Z = 2.0                     # |z| at or above -> entry_signal
+EXIT_Z = 0.5                      # |z| at or below -> exit_signal
+LOOKBACK_DAYS = 200               # calendar days re-read before the last stored signal date
+HISTORY_DAYS = 3 * 365            # first run depth
+# signal_runs.status values; signal_runs_status_check only allows ok / failed / partial
+STATUS_RUNNING, STATUS_OK, STATUS_FAILED = "partial", "ok", "failed"
+# --------------------------
+
+def json_rows(df: pd.DataFrame) -> list:
+    return json.loads(df.to_json(orient="records"))
+
+def rolling_sum(a: np.ndarray, window: int) -> np.ndarray:
+    """Trailing window sums along axis 0 via one cumsum (the first rows use what exists)."""
+    c = np.cumsum(a, axis=0)
+    out = c.copy()
+    out[window:] -= c[:-window]
+    return out
+
+def hedge_signals(y: np.ndarray, x: np.ndarray, beta_window: int = BETA_WINDOW,
+                  z_window: int = Z_WINDOW, min_obs: int = MIN_OBS):
+    """
+    y: T x N ticker log returns, x: T x F factor log returns (NaN = missing).
+    Returns (beta, z), both T x N x F, for every ticker/factor pair at once.
+
+    beta is the rolling OLS slope of y on x over paired observations. z is the
+    standardized spread log P_y - beta * log P_x against its own trailing
+    window, with mean and variance expanded from rolling sums of the two
+    cumulative log-price paths so nothing is refit per date.
+    """
+    vy, vx = ~np.isnan(y), ~np.isnan(x)
+    m = vy[:, :, None] & vx[:, None, :]
+    Y = np.where(m, np.nan_to_num(y)[:, :, None], 0.0)
+    X = np.where(m, np.nan_to_num(x)[:, None, :], 0.0)
+
+    n = rolling_sum(m.astype(float), beta_window)
+    sx, sy = rolling_sum(X, beta_window), rolling_sum(Y, beta_window)
+    sxx, sxy = rolling_sum(X * X, beta_window), rolling_sum(X * Y, beta_window)
+    den = n * sxx - sx * sx
+    ok = (n >= min_obs) & (den > 1e-18)
+    beta = np.where(ok, (n * sxy - sx * sy) / np.where(ok, den, 1.0), np.nan)
+
+    ly = np.cumsum(np.nan_to_num(y), axis=0)[:, :, None]   # log price paths, held flat on gaps
+    lx = np.cumsum(np.nan_to_num(x), axis=0)[:, None, :]
+    k = np.minimum(np.arange(1, len(y) + 1), z_window)[:, None, None].astype(float)
+    my, mx = rolling_sum(ly, z_window) / k, rolling_sum(lx, z_window) / k
+    vyy = rolling_sum(ly * ly, z_window) / k - my * my
+    vxx = rolling_sum(lx * lx, z_window) / k - mx * mx
+    cxy = rolling_sum(ly * lx, z_window) / k - my * mx
+
+    spread = ly - beta * lx
+    mean_s = my - beta * mx
+    var_s = vyy + beta * beta * vxx - 2.0 * beta * cxy
+    z = np.where(var_s > 1e-18, (spread - mean_s) / np.sqrt(np.abs(var_s)), np.nan)
+    z[k[:, 0, 0] < min_obs] = np.nan
+    return beta, z
+
+def fetch_factor_returns(sb, slugs, since: dt.date) -> pd.DataFrame:
+    rows = fetch_all(lambda: (
+        sb.table("factor_values")
+          .select("slug, dt, level")
+          .in_("slug", slugs)
+          .gte("dt", since.strftime("%Y-%m-%d"))
+          .not_.is_("level", "null")
+          .order("slug").order("dt")
+    ))
+    df = pd.DataFrame(rows, columns=["slug", "dt", "level"])
+    df["dt"] = pd.to_datetime(df["dt"])
+    df["level"] = pd.to_numeric(df["level"], errors="coerce")
+    levels = df.pivot_table(index="dt", columns="slug", values="level", aggfunc="last")
+    return returns_store.log_returns(levels.reindex(columns=slugs))
+
+def last_signal_dt(sb, slugs) -> pd.Series:
+    """{factor_slug: last stored signal dt}, NaT for a slug with none yet (so it gets its full history)."""
+    last = {}
+    for slug in slugs:
+        r = (sb.table("factor_signals").select("dt").eq("factor_slug", slug)
+               .order("dt", desc=True).limit(1).execute())
+        last[slug] = pd.Timestamp(r.data[0]["dt"]) if r.data else pd.NaT
+    return pd.Series(last, index=slugs, dtype="datetime64[ns]")
+
+def run(sb, slugs, tickers=None, full: bool = False) -> int:
+    if not slugs:
+        raise SystemExit("[ERROR] No factor slugs given (set FACTOR_SLUGS or pass them as arguments).")
+    tickers = [t.upper() for t in (tickers or load_tickers())]
+    last = pd.Series(pd.NaT, index=slugs, dtype="datetime64[ns]") if full else last_signal_dt(sb, slugs)
+    since = (last.min() - pd.Timedelta(days=LOOKBACK_DAYS)).date() if last.notna().all() \
+        else dt.date.today() - dt.timedelta(days=HISTORY_DAYS)
+
+    _, rets = returns_store.update(sb, tickers)
+    y = rets.reindex(columns=tickers).loc[pd.Timestamp(since):]
+    x = fetch_factor_returns(sb, slugs, since)
+    dates = y.index.union(x.index)
+    y, x = y.reindex(dates), x.reindex(dates)
+
+    run_id = str(uuid.uuid4())
+    sb.table("signal_runs").insert({"run_id": run_id, "status": STATUS_RUNNING, "factors_run": slugs,
+                                    "notes": f"beta_window={BETA_WINDOW} z_window={Z_WINDOW}"}).execute()
+    try:
+        beta, z = hedge_signals(y.to_numpy(dtype=float), x.to_numpy(dtype=float))
+
+        # flatten T x N x F to long rows, only dates past each slug's last signal with a usable z
+        new = (dates.to_numpy()[:, None] > last.to_numpy()[None, :]) | last.isna().to_numpy()[None, :]
+        t_idx, n_idx, f_idx = np.nonzero(new[:, None, :] & np.isfinite(z))
+        zz, bb = z[t_idx, n_idx, f_idx], beta[t_idx, n_idx, f_idx]
+        tick = np.asarray(tickers)[n_idx]
+        fac = np.asarray(slugs)[f_idx]
+        df = pd.DataFrame({
+            "run_id": run_id,
+            "dt": dates[t_idx].strftime("%Y-%m-%d"),
+            "ticker": tick,
+            "factor_slug": fac,
+            "z_score": zz,
+            "entry_signal": np.abs(zz) >= ENTRY_Z,
+            "exit_signal": np.abs(zz) <= EXIT_Z,
+        })
+        rows = json_rows(df)
+        for row, t, f, b in zip(rows, tick, fac, bb):
+            row["hedge_weights"] = {str(t): 1.0, str(f): -float(b)}
+        n = upsert_rows(sb, "factor_signals", rows, on_conflict="dt,ticker,factor_slug")
+        sb.table("signal_runs").update({"status": STATUS_OK, "completed_at": dt.datetime.now(dt.timezone.utc).isoformat(),
+                                        "notes": f"beta_window={BETA_WINDOW} z_window={Z_WINDOW} rows={n}"}) \
+          .eq("run_id", run_id).execute()
+    except Exception as e:
+        sb.table("signal_runs").update({"status": STATUS_FAILED, "completed_at": dt.datetime.now(dt.timezone.utc).isoformat(),
+                                        "notes": str(e)}).eq("run_id", run_id).execute()
+        raise
+    print(f"[OK] factor_signals: {n} rows for {len(tickers)} tickers x {len(slugs)} factors (run {run_id})")
+    return n
+
+def main():
+    full = "--full" in sys.argv
+    slugs = [a for a in sys.argv[1:] if not a.startswith("--")] or FACTOR_SLUGS
+    run(get_client(), slugs, full=full)
+
+if __name__ == "__main__":
+    main()
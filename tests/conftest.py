@@ -0,0 +1,113 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+class _Query:
+    """The slice of the PostgREST builder the pipeline uses for reads and upserts."""
+    def __init__(self, db: dict, table: str):
+        self.rows = db.setdefault(table, [])
+        self.filters, self.orders, self.window, self.cap, self.payload = [], [], None, None, None
+        self.negate = False
+        self.inserts, self.changes = None, None
+
+    def select(self, cols):
+        self.cols = [c.strip() for c in cols.split(",")]
+        return self
+
+    def eq(self, c, v):
+        self.filters.append(lambda r: r.get(c) == v)
+        return self
+
+    def in_(self, c, vals):
+        vals = set(vals)
+        self.filters.append(lambda r: r.get(c) in vals)
+        return self
+
+    @property
+    def not_(self):
+        self.negate = True
+        return self
+
+    def is_(self, c, v):
+        # only `is null` is used by the pipeline
+        neg, self.negate = self.negate, False
+        self.filters.append(lambda r: (r.get(c) is None) != neg)
+        return self
+
+    def _cmp(self, c, v, op):
+        self.filters.append(lambda r: r.get(c) is not None and op(str(r.get(c)), str(v)))
+        return self
+
+    def gte(self, c, v): return self._cmp(c, v, str.__ge__)
+    def lte(self, c, v): return self._cmp(c, v, str.__le__)
+    def gt(self, c, v): return self._cmp(c, v, str.__gt__)
+    def lt(self, c, v): return self._cmp(c, v, str.__lt__)
+
+    def order(self, c, desc=False):
+        self.orders.append((c, desc))
+        return self
+
+    def range(self, a, b):
+        self.window = (a, b)
+        return self
+
+    def limit(self, n):
+        self.cap = n
+        return self
+
+    def upsert(self, rows, on_conflict):
+        self.payload = (rows, [k.strip() for k in on_conflict.split(",")])
+        return self
+
+    def insert(self, rows):
+        self.inserts = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def update(self, values):
+        self.changes = values
+        return self
+
+    def execute(self):
+        if self.inserts is not None:
+            self.rows.extend(dict(r) for r in self.inserts)
+            return _Result(self.inserts)
+        if self.changes is not None:
+            hit = [r for r in self.rows if all(f(r) for f in self.filters)]
+            for r in hit:
+                r.update(self.changes)
+            return _Result(hit)
+        if self.payload is not None:
+            rows, keys = self.payload
+            for r in rows:
+                hit = [x for x in self.rows if all(x.get(k) == r.get(k) for k in keys)]
+                hit[0].update(r) if hit else self.rows.append(dict(r))
+            return _Result(rows)
+        out = [r for r in self.rows if all(f(r) for f in self.filters)]
+        for c, desc in reversed(self.orders):
+            out.sort(key=lambda r: (r.get(c) is None, r.get(c)), reverse=desc)
+        if self.window:
+            out = out[self.window[0]:self.window[1] + 1]
+        if self.cap is not None:
+            out = out[:self.cap]
+        return _Result([{c: r.get(c) for c in self.cols} for r in out])
+
+class FakeClient:
+    def __init__(self):
+        self.db = {}
+
+    def table(self, name):
+        return _Query(self.db, name)
+
+def use_store(monkeypatch, path):
+    """Point the returns store at a scratch directory."""
+    import returns_store
+    monkeypatch.setattr(returns_store, "STORE_DIR", path)
+    monkeypatch.setattr(returns_store, "PRICES_FILE", path / "prices.pkl")
+    monkeypatch.setattr(returns_store, "RETURNS_FILE", path / "returns.pkl")
+    monkeypatch.setattr(returns_store, "META_FILE", path / "meta.json")
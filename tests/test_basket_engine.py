@@ -0,0 +1,109 @@
+# tests/test_basket_engine.py
+import datetime as dt
+import numpy as np
+import pandas as pd
+import pytest
+
+import basket_engine
+import returns_store
+from conftest import FakeClient, use_store
+
+def naive_levels(members: pd.DataFrame, fixed: bool, base_i: int, prices: pd.DataFrame) -> np.ndarray:
+    """
+    Share-holdings loop: buy target weights at the launch close and at the
+    close before every day whose member set changes, mark to market daily.
+    """
+    px = prices.ffill().to_numpy()
+    dates, tickers = prices.index, list(prices.columns)
+
+    def target(d):
+        w = basket_engine.target_weights(members, d, fixed)
+        return w.reindex(tickers).fillna(0.0).to_numpy()
+
+    value = np.full(len(dates), np.nan)
+    value[base_i] = 1.0
+    shares = target(dates[base_i]) / px[base_i]
+    for t in range(base_i + 1, len(dates)):
+        w = target(dates[t])
+        if not np.allclose(w, target(dates[t - 1])):
+            shares = w * value[t - 1] / px[t - 1]
+        value[t] = shares @ px[t]
+    return value
+
+@pytest.fixture
+def prices():
+    rng = np.random.default_rng(3)
+    dates = pd.bdate_range("2024-01-01", periods=80)
+    px = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0, 0.02, (80, 5)), axis=0)),
+                      index=dates, columns=["AAA", "BBB", "CCC", "DDD", "EEE"])
+    px.iloc[20:23, 1] = np.nan                     # a gap: held flat
+    px.iloc[50, 3] = np.nan
+    return px
+
+def members_frame(rows):
+    m = pd.DataFrame(rows, columns=["slug", "ticker", "weight", "valid_from", "valid_to"])
+    for c in ("valid_from", "valid_to"):
+        m[c] = pd.to_datetime(m[c])
+    return m
+
+@pytest.mark.parametrize("method", ["equal_weight", "fixed_weight"])
+def test_growth_chain_links_like_naive_holdings(prices, method):
+    d = prices.index
+    members = members_frame([
+        ("b", "AAA", 2.0, d[0], None),
+        ("b", "BBB", 1.0, d[0], d[30]),
+        ("b", "CCC", 3.0, d[31], d[60]),
+        ("b", "DDD", 1.0, d[10], None),
+        ("b", "EEE", 4.0, d[45], None),
+    ])
+    baskets = pd.DataFrame({"slug": ["b"], "method": [method], "base_dt": [d[5]]})
+    fixed = basket_engine.WEIGHTING[method] == "fixed"
+
+    tickers = list(prices.columns)
+    W = basket_engine.membership_weights(members, baskets, d, tickers)
+    launch = np.zeros((1, len(d)), dtype=bool)
+    launch[0, 6] = True
+    G = basket_engine.basket_growth(W, returns_store.log_returns(prices).to_numpy(), launch)[0]
+
+    expected = naive_levels(members, fixed, 5, prices)
+    np.testing.assert_allclose(G[5:] / G[5], expected[5:], rtol=1e-10)
+
+def test_incremental_run_matches_full_run(tmp_path, monkeypatch):
+    rng = np.random.default_rng(11)
+    dates = pd.bdate_range(end=dt.date.today(), periods=90)
+    tickers = ["AAA", "BBB", "CCC", "DDD"]
+    px = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, (len(dates), len(tickers))), axis=0))
+    prices = [{"ticker": t, "dt": d.strftime("%Y-%m-%d"), "adj_close": float(px[i, k]),
+               "updated_at": f"2024-01-01T00:00:{i:02d}"}
+              for i, d in enumerate(dates) for k, t in enumerate(tickers)]
+    day = lambda i: dates[i].strftime("%Y-%m-%d")
+    baskets = [
+        {"slug": "hold", "name": "Buy and hold", "method": "fixed_weight", "base_dt": day(5), "base_value": 100},
+        {"slug": "recon", "name": "Reconstituted", "method": "equal_weight", "base_dt": day(5), "base_value": 1000},
+    ]
+    members = [
+        {"slug": "hold", "ticker": "AAA", "weight": 0.6, "valid_from": day(0), "valid_to": None},
+        {"slug": "hold", "ticker": "BBB", "weight": 0.4, "valid_from": day(0), "valid_to": None},
+        {"slug": "recon", "ticker": "AAA", "weight": None, "valid_from": day(0), "valid_to": None},
+        {"slug": "recon", "ticker": "BBB", "weight": None, "valid_from": day(0), "valid_to": day(40)},
+        {"slug": "recon", "ticker": "CCC", "weight": None, "valid_from": day(41), "valid_to": None},
+        {"slug": "recon", "ticker": "DDD", "weight": None, "valid_from": day(85), "valid_to": None},
+    ]
+    cut = 80
+    sb = FakeClient()
+    sb.db.update(baskets=baskets, basket_members=members,
+                 prices_daily=[r for r in prices if r["dt"] <= day(cut)])
+    use_store(monkeypatch, tmp_path / "inc")
+    basket_engine.run(sb, full=True)
+    sb.db["prices_daily"] = prices
+    basket_engine.run(sb)
+
+    full = FakeClient()
+    full.db.update(baskets=baskets, basket_members=members, prices_daily=prices)
+    use_store(monkeypatch, tmp_path / "full")
+    basket_engine.run(full, full=True)
+
+    key = lambda rows: pd.DataFrame(rows).set_index(["slug", "dt"])["level"].sort_index()
+    inc, ref = key(sb.db["factor_values"]), key(full.db["factor_values"])
+    assert inc.index.equals(ref.index) and inc.index.get_level_values("dt").max() == day(89)
+    np.testing.assert_allclose(inc.to_numpy(), ref.to_numpy(), rtol=1e-10)
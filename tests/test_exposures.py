@@ -0,0 +1,74 @@
+# tests/test_exposures.py
+import datetime as dt
+import numpy as np
+import pandas as pd
+import pytest
+
+import exposures
+from conftest import FakeClient, use_store
+
+def naive_window(y, x, t, window):
+    """X'X, X'y and count over rows (t - window, t] by direct summation."""
+    z, m, y0 = exposures.design(y, x)
+    lo = max(t - window + 1, 0)
+    mf = m[lo:t + 1].astype(float)
+    sxx = np.einsum("sn,si,sj->nij", mf, z[lo:t + 1], z[lo:t + 1])
+    sxy = np.einsum("sn,si->ni", y0[lo:t + 1], z[lo:t + 1])
+    return sxx, sxy, mf.sum(axis=0)
+
+@pytest.mark.parametrize("start", [0, 17, 90])
+def test_running_window_sums_match_direct_sums(start):
+    rng = np.random.default_rng(1)
+    y = rng.normal(size=(150, 6))
+    y[rng.random(y.shape) < 0.1] = np.nan
+    x = rng.normal(size=(150, 3))
+    x[40, 2] = np.nan
+    seen = []
+    for rows, sxx, sxy, n in exposures.ols_moments(y, x, start, window=30, chunk=11):
+        for k, t in enumerate(rows):
+            exp_xx, exp_xy, exp_n = naive_window(y, x, t, 30)
+            np.testing.assert_allclose(sxx[k], exp_xx, atol=1e-9)
+            np.testing.assert_allclose(sxy[k], exp_xy, atol=1e-9)
+            np.testing.assert_allclose(n[k], exp_n)
+        seen += rows.tolist()
+    assert seen == list(range(start, 150))
+
+def make_client(dates, tickers, factors, rng):
+    sb = FakeClient()
+    sb.db["factors"] = [{"factor_id": i + 1, "name": f} for i, f in enumerate(factors)]
+    fx = rng.normal(0, 0.01, (len(dates), len(factors)))
+    sb.db["factor_values"] = [{"slug": f, "dt": d.strftime("%Y-%m-%d"), "level": float(100 * np.exp(fx[:i + 1, k].sum()))}
+                              for k, f in enumerate(factors) for i, d in enumerate(dates)]
+    px = 100 * np.exp(np.cumsum(fx @ rng.normal(1, 0.3, (len(factors), len(tickers)))
+                                + rng.normal(0, 0.01, (len(dates), len(tickers))), axis=0))
+    sb.db["prices_daily"] = [{"ticker": t, "dt": d.strftime("%Y-%m-%d"), "adj_close": float(px[i, k]),
+                              "updated_at": "2024-01-01T00:00:00"}
+                             for k, t in enumerate(tickers) for i, d in enumerate(dates)]
+    return sb
+
+def stored(sb):
+    df = pd.DataFrame(sb.db["instrument_factor_exposures"])
+    return df.set_index(["ticker", "factor_id", "dt"])["exposure"].sort_index()
+
+def test_new_factor_and_ticker_get_history(tmp_path, monkeypatch):
+    monkeypatch.setattr(exposures, "WINDOW", 40)
+    monkeypatch.setattr(exposures, "MIN_OBS", 20)
+    rng = np.random.default_rng(4)
+    dates = pd.bdate_range(end=dt.date.today(), periods=120)
+    sb = make_client(dates, ["AAA", "BBB", "CCC"], ["mkt", "size"], rng)
+    levels = sb.db["factor_values"]
+    use_store(monkeypatch, tmp_path / "inc")
+    sb.db["factor_values"] = [r for r in levels if r["slug"] == "mkt"]
+    exposures.run(sb, tickers=["AAA", "BBB"], full=True)
+    sb.db["factor_values"] = levels
+    exposures.run(sb, tickers=["AAA", "BBB"])                    # factor `size` is new
+    exposures.run(sb, tickers=["AAA", "BBB", "CCC"])             # ticker CCC is new
+    assert exposures.run(sb, tickers=["AAA", "BBB", "CCC"]) == 0
+
+    ref = make_client(dates, [], [], rng)
+    ref.db.update(factors=sb.db["factors"], factor_values=levels, prices_daily=sb.db["prices_daily"])
+    use_store(monkeypatch, tmp_path / "full")
+    exposures.run(ref, tickers=["AAA", "BBB", "CCC"], full=True)
+    inc, full = stored(sb), stored(ref)
+    assert inc.index.equals(full.index)
+    np.testing.assert_allclose(inc.to_numpy(), full.to_numpy(), rtol=1e-8)
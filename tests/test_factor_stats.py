@@ -0,0 +1,25 @@
+# tests/test_factor_stats.py
+import numpy as np
+import pandas as pd
+
+import factor_stats
+from conftest import FakeClient
+
+def level_rows(slug, dates, source, rng):
+    lv = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(dates))))
+    return [{"slug": slug, "dt": d.strftime("%Y-%m-%d"), "level": float(x), "source": source} for d, x in zip(dates, lv)]
+
+def test_incremental_stats_leave_source_alone():
+    rng = np.random.default_rng(5)
+    dates = pd.bdate_range("2024-01-01", periods=300)
+    sb = FakeClient()
+    sb.db["factor_values"] = level_rows("xl", dates[:280], "excel", rng) + level_rows("bk", dates[:280], "basket", rng)
+    assert factor_stats.run(sb, ["xl", "bk"]) == 2 * 279
+    assert factor_stats.run(sb, ["xl", "bk"]) == 0
+
+    sb.db["factor_values"] += level_rows("xl", dates[280:], "excel", rng)
+    assert factor_stats.run(sb, ["xl", "bk"]) == 20
+    rows = pd.DataFrame(sb.db["factor_values"])
+    assert set(rows.groupby("slug")["source"].unique().map(tuple)) == {("excel",), ("basket",)}
+    assert rows.groupby("slug")["r_1d"].apply(lambda s: s.isna().sum()).eq(1).all()
+    assert rows["z_r1d_252"].notna().sum() == (280 - 252) + (300 - 252)
@@ -0,0 +1,22 @@
+# tests/test_pubco.py
+import pytest
+
+import pubco
+
+def test_run_stops_before_erc_after_blockwise_cov(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "outputs").mkdir()
+    (tmp_path / "outputs" / "cov_annual.npy").touch()
+    ran = []
+    for name in ("update", "cov", "erc", "viz"):
+        monkeypatch.setattr(pubco, f"cmd_{name}", lambda args, name=name: ran.append(name))
+    pubco.main(["run"])
+    assert ran == ["update", "cov"]
+
+def test_erc_fails_clearly_on_blockwise_outputs(tmp_path, monkeypatch):
+    import compute_erc
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "outputs").mkdir()
+    (tmp_path / "outputs" / "cov_annual.npy").touch()
+    with pytest.raises(SystemExit, match="blockwise"):
+        compute_erc.main()
@@ -0,0 +1,83 @@
+# tests/test_returns_store.py
+import datetime as dt
+import numpy as np
+import pandas as pd
+import pytest
+
+import db
+import returns_store
+from conftest import FakeClient, use_store
+
+def price_rows(tickers, dates, rng, stamp, skip=()):
+    rows = []
+    for t in tickers:
+        px = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(dates))))
+        for d, p in zip(dates, px):
+            if (t, d) not in skip:
+                rows.append({"ticker": t, "dt": d.strftime("%Y-%m-%d"), "adj_close": float(p), "updated_at": stamp})
+    return rows
+
+@pytest.fixture
+def panel():
+    rng = np.random.default_rng(7)
+    dates = pd.bdate_range(end=dt.date.today(), periods=120)
+    gaps = {("BBB", dates[30]), ("BBB", dates[31]), ("CCC", dates[95])}
+    sb = FakeClient()
+    sb.db["prices_daily"] = price_rows(["AAA", "BBB", "CCC"], dates[:100], rng, "2024-01-01T00:00:00", gaps)
+    return sb, dates, rng
+
+def test_incremental_update_matches_full_rebuild(panel, tmp_path, monkeypatch):
+    sb, dates, rng = panel
+    use_store(monkeypatch, tmp_path / "inc")
+    returns_store.update(sb, ["AAA", "BBB", "CCC"])
+
+    rows = sb.db["prices_daily"]
+    # appended days, a re-adjusted stretch of history, a gap filled late, and a new ticker
+    rows += price_rows(["AAA", "BBB", "CCC"], dates[100:], rng, "2024-02-01T00:00:00")
+    for r in rows:
+        if r["ticker"] == "AAA" and r["dt"] >= dates[60].strftime("%Y-%m-%d"):
+            r["adj_close"] *= 0.5
+            r["updated_at"] = "2024-02-02T00:00:00"
+    rows.append({"ticker": "BBB", "dt": dates[31].strftime("%Y-%m-%d"), "adj_close": 101.0,
+                 "updated_at": "2024-02-03T00:00:00"})
+    rows += price_rows(["DDD"], dates[50:], rng, "2024-02-01T00:00:00")
+    prices_inc, rets_inc = returns_store.update(sb, ["AAA", "BBB", "CCC", "DDD"])
+
+    use_store(monkeypatch, tmp_path / "full")
+    prices_full, rets_full = returns_store.update(sb, ["AAA", "BBB", "CCC", "DDD"])
+
+    cols = sorted(prices_full.columns)
+    pd.testing.assert_frame_equal(prices_inc[cols], prices_full[cols], check_freq=False)
+    pd.testing.assert_frame_equal(rets_inc[cols], rets_full[cols], check_freq=False)
+
+def test_noop_update_leaves_store_unchanged(panel, tmp_path, monkeypatch):
+    sb, _, _ = panel
+    use_store(monkeypatch, tmp_path)
+    prices, rets = returns_store.update(sb, ["AAA", "BBB", "CCC"])
+    prices2, rets2 = returns_store.update(sb, ["AAA", "BBB", "CCC"])
+    pd.testing.assert_frame_equal(prices, prices2)
+    pd.testing.assert_frame_equal(rets, rets2)
+
+def test_backfill_to_since_dt_matches_full_rebuild(panel, tmp_path, monkeypatch):
+    sb, dates, _ = panel
+    monkeypatch.setattr(returns_store, "HISTORY_YEARS", 0.1)
+    use_store(monkeypatch, tmp_path / "inc")
+    returns_store.update(sb, ["AAA", "BBB", "CCC"])
+    since = dates[10].date()
+    prices_inc, rets_inc = returns_store.update(sb, ["AAA", "BBB", "CCC"], since_dt=since)
+    assert prices_inc.index.min() == dates[10]
+
+    use_store(monkeypatch, tmp_path / "full")
+    prices_full, rets_full = returns_store.update(sb, ["AAA", "BBB", "CCC"], since_dt=since)
+    pd.testing.assert_frame_equal(prices_inc, prices_full, check_freq=False)
+    pd.testing.assert_frame_equal(rets_inc, rets_full, check_freq=False)
+
+def test_ticker_batches_give_the_same_store(panel, tmp_path, monkeypatch):
+    sb, _, _ = panel
+    use_store(monkeypatch, tmp_path / "one")
+    prices, rets = returns_store.update(sb, ["AAA", "BBB", "CCC"])
+    monkeypatch.setattr(returns_store, "in_batches", lambda v: db.in_batches(v, size=1))
+    use_store(monkeypatch, tmp_path / "many")
+    prices2, rets2 = returns_store.update(sb, ["AAA", "BBB", "CCC"])
+    pd.testing.assert_frame_equal(prices, prices2)
+    pd.testing.assert_frame_equal(rets, rets2)
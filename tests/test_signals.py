@@ -0,0 +1,49 @@
+# tests/test_signals.py
+import re
+import datetime as dt
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pytest
+
+import signals
+from conftest import FakeClient, use_store
+
+MIGRATIONS = Path(__file__).resolve().parents[1] / "supabase" / "migrations"
+
+def allowed_statuses() -> set:
+    """Values permitted by signal_runs_status_check in the schema migrations."""
+    sql = "\n".join(p.read_text() for p in sorted(MIGRATIONS.glob("*.sql")))
+    m = re.search(r'"signal_runs_status_check" CHECK \(\(status = ANY \(ARRAY\[(.*?)\]\)\)\)', sql)
+    assert m, "signal_runs_status_check not found in migrations"
+    return set(re.findall(r"'(\w+)'::text", m.group(1)))
+
+def test_status_values_satisfy_schema_constraint():
+    assert {signals.STATUS_RUNNING, signals.STATUS_OK, signals.STATUS_FAILED} <= allowed_statuses()
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    use_store(monkeypatch, tmp_path)
+    rng = np.random.default_rng(2)
+    dates = pd.bdate_range(end=dt.date.today(), periods=120)
+    sb = FakeClient()
+    px = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(dates))))
+    sb.db["prices_daily"] = [{"ticker": "AAA", "dt": d.strftime("%Y-%m-%d"), "adj_close": float(p),
+                              "updated_at": "2024-01-01T00:00:00"} for d, p in zip(dates, px)]
+    lv = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(dates))))
+    sb.db["factor_values"] = [{"slug": "f1", "dt": d.strftime("%Y-%m-%d"), "level": float(x)}
+                              for d, x in zip(dates, lv)]
+    return sb
+
+def test_run_records_allowed_statuses(client):
+    assert signals.run(client, ["f1"], tickers=["AAA"]) > 0
+    assert [r["status"] for r in client.db["signal_runs"]] == [signals.STATUS_OK]
+
+def test_failed_run_records_allowed_status(client, monkeypatch):
+    def boom(*a, **k):
+        raise RuntimeError("boom")
+    monkeypatch.setattr(signals, "hedge_signals", boom)
+    with pytest.raises(RuntimeError):
+        signals.run(client, ["f1"], tickers=["AAA"])
+    assert [r["status"] for r in client.db["signal_runs"]] == [signals.STATUS_FAILED]
+    assert {r["status"] for r in client.db["signal_runs"]} <= allowed_statuses()
@@ -0,0 +1,108 @@
+# universe.py
+import sys, datetime as dt
+from typing import Optional
+import numpy as np
+import pandas as pd
+
+from db import get_client, fetch_all
+
+class MembershipIndex:
+    """
+    Point-in-time membership for many keys (universes or tags), built once per run.
+
+    Per key, every valid_from and day-after-valid_to becomes a change point; the
+    member set between two change points is one boolean row. Intervals are
+    inclusive and open-ended when valid_to is null. An as-of lookup is one
+    binary search over the change points (O(log n)) plus a row read.
+    """
+    def __init__(self, rows: pd.DataFrame, key_col: str):
+        self.key_col = key_col
+        self.points, self.masks, self.tickers = {}, {}, {}
+        rows = rows.assign(
+            ticker=rows["ticker"].str.upper(),
+            valid_from=pd.to_datetime(rows["valid_from"]),
+            valid_to=pd.to_datetime(rows["valid_to"]),
+        )
+        for key, g in rows.groupby(key_col):
+            tickers = sorted(g["ticker"].unique())
+            ends = g["valid_to"] + pd.Timedelta(days=1)        # first day no longer valid
+            points = pd.DatetimeIndex(pd.concat([g["valid_from"], ends.dropna()]).unique()).sort_values()
+            col = pd.Index(tickers).get_indexer(g["ticker"])
+            i0 = points.searchsorted(g["valid_from"].to_numpy())
+            i1 = np.where(ends.isna(), len(points), points.searchsorted(ends.fillna(points.max()).to_numpy()))
+            D = np.zeros((len(points) + 1, len(tickers)), dtype=int)
+            np.add.at(D, (i0, col), 1)
+            np.add.at(D, (i1, col), -1)
+            self.points[key] = points
+            self.masks[key] = np.cumsum(D[:-1], axis=0) > 0
+            self.tickers[key] = np.array(tickers)
+
+    @property
+    def keys(self) -> list:
+        return sorted(self.points)
+
+    def _row(self, key, when) -> int:
+        if key not in self.points:
+            raise KeyError(f"unknown {self.key_col}: {key}")
+        return int(self.points[key].searchsorted(pd.Timestamp(when), side="right")) - 1
+
+    def as_of(self, key, when) -> list:
+        i = self._row(key, when)
+        return [] if i < 0 else self.tickers[key][self.masks[key][i]].tolist()
+
+    def during(self, key, start, end) -> list:
+        """Every ticker that was a member at any point in [start, end]."""
+        i0, i1 = max(self._row(key, start), 0), self._row(key, end)
+        if i1 < 0:
+            return []
+        return self.tickers[key][self.masks[key][i0:i1 + 1].any(axis=0)].tolist()
+
+    def mask(self, key, dates, tickers=None) -> pd.DataFrame:
+        """Boolean dates x tickers membership frame aligned to a price/return panel."""
+        dates = pd.DatetimeIndex(dates)
+        idx = self._row_many(key, dates)
+        rows = np.zeros((len(dates), len(self.tickers[key])), dtype=bool)
+        hit = idx >= 0
+        rows[hit] = self.masks[key][idx[hit]]
+        out = pd.DataFrame(rows, index=dates, columns=self.tickers[key])
+        return out if tickers is None else out.reindex(columns=[t.upper() for t in tickers], fill_value=False)
+
+    def _row_many(self, key, dates: pd.DatetimeIndex) -> np.ndarray:
+        if key not in self.points:
+            raise KeyError(f"unknown {self.key_col}: {key}")
+        return self.points[key].searchsorted(dates, side="right") - 1
+
+def load_universe_index(sb) -> MembershipIndex:
+    rows = fetch_all(lambda: (sb.table("universe_membership")
+                                .select("universe, ticker, valid_from, valid_to")
+                                .order("universe").order("ticker").order("valid_from")))
+    return MembershipIndex(pd.DataFrame(rows, columns=["universe", "ticker", "valid_from", "valid_to"]), "universe")
+
+def load_tag_index(sb) -> MembershipIndex:
+    rows = fetch_all(lambda: (sb.table("instrument_tags")
+                                .select("tag, ticker, valid_from, valid_to")
+                                .order("tag").order("ticker").order("valid_from")))
+    return MembershipIndex(pd.DataFrame(rows, columns=["tag", "ticker", "valid_from", "valid_to"]), "tag")
+
+def resolve(universes: MembershipIndex, universe: str, when, tags: Optional[MembershipIndex] = None,
+            tag: Optional[str] = None) -> list:
+    """Members of `universe` on `when`, optionally restricted to those carrying `tag` that day."""
+    out = universes.as_of(universe, when)
+    if tags is not None and tag:
+        tagged = set(tags.as_of(tag, when))
+        out = [t for t in out if t in tagged]
+    return out
+
+def main():
+    if len(sys.argv) < 2:
+        raise SystemExit("usage: python universe.py UNIVERSE [YYYY-MM-DD] [TAG]")
+    universe = sys.argv[1]
+    when = pd.Timestamp(sys.argv[2]) if len(sys.argv) > 2 else pd.Timestamp(dt.date.today())
+    tag = sys.argv[3] if len(sys.argv) > 3 else None
+    sb = get_client()
+    tickers = resolve(load_universe_index(sb), universe, when, load_tag_index(sb) if tag else None, tag)
+    print(f"[INFO] {universe} as of {when.date()}{f' tagged {tag}' if tag else ''}: {len(tickers)} tickers")
+    print(", ".join(tickers))
+
+if __name__ == "__main__":
+    main()
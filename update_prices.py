@@ -1,9 +1,8 @@
 # update_prices.py
-import os, datetime as dt, json, sys
+import datetime as dt, json, sys
 import pandas as pd
-import yfinance as yf
-from supabase import create_client
-from dotenv import load_dotenv
+
+from db import get_client
 
 TICKERS_FILE = "tickers.txt"  # one ticker per line
 
@@ -14,12 +13,9 @@ def load_tickers(path=TICKERS_FILE):
 def json_rows(df: pd.DataFrame) -> list:
     return json.loads(df.to_json(orient="records"))
 
-load_dotenv()
-sb = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_ANON_KEY"])
-
 def get_last_date(ticker: str):
     r = (
-        sb.table("prices_daily")
+        get_client().table("prices_daily")
           .select("dt")
           .eq("ticker", ticker.upper())
           .order("dt", desc=True)
@@ -32,6 +28,7 @@ def get_last_date(ticker: str):
     return dt.datetime.strptime(r.data[0]["dt"], "%Y-%m-%d").date()
 
 def fetch_since(ticker: str, start: dt.date, end: dt.date) -> pd.DataFrame:
+    import yfinance as yf
     df = yf.download(
         ticker,
         start=start,
@@ -64,4 +61,30 @@ def fetch_since(ticker: str, start: dt.date, end: dt.date) -> pd.DataFrame:
 
 def upsert_df(df: pd.DataFrame) -> int:
     if df.empty:
-        return
+        return 0
+    rows = json_rows(df)
+    total = 0
+    chunk = 1000
+    sb = get_client()
+    for i in range(0, len(rows), chunk):
+        sb.table("prices_daily").upsert(rows[i:i+chunk], on_conflict="ticker,dt").execute()
+        total += len(rows[i:i+chunk])
+    return total
+
+def main():
+    tickers = [a.upper() for a in sys.argv[1:]] or load_tickers()
+    today = dt.date.today()
+    for t in tickers:
+        last = get_last_date(t)
+        if last is None:
+            print(f"[WARN] {t}: no history yet; run seed_prices.py first.")
+            continue
+        start = last - dt.timedelta(days=1)          # re-read a day to catch late adjustments
+        try:
+            n = upsert_df(fetch_since(t, start, today + dt.timedelta(days=1)))
+            print(f"[OK] {t}: upserted {n} rows from {start} (last was {last})")
+        except Exception as e:
+            print(f"[ERROR] {t}: {e}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
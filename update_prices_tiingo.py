@@ -1,12 +1,14 @@
 # update_prices_tiingo.py
 import os, sys, json, time, uuid
 import datetime as dt
+from functools import lru_cache
 from zoneinfo import ZoneInfo
 
 import requests
 import pandas as pd
 from dotenv import load_dotenv
-from supabase import create_client
+
+from db import get_client, get_session
 
 # ---------- Config ----------
 TICKER_MAP_FILE = "ticker_map.csv"        # optional: columns: ticker,tiingo_ticker
@@ -15,22 +17,18 @@ NY_TZ = ZoneInfo("America/New_York")
 INCREMENTAL_BUFFER_DAYS = 1               # re-fetch a small window to catch late adj.
 
 # ---------- Setup ----------
-load_dotenv()
-SUPABASE_URL = os.environ["SUPABASE_URL"]
-SUPABASE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or os.environ["SUPABASE_ANON_KEY"]
-TIINGO_TOKEN = os.environ["TIINGO_TOKEN"]
-FORCE_REBUILD_ENV = (os.environ.get("FORCE_REBUILD") or "").strip()
-
-if not TIINGO_TOKEN:
-    raise SystemExit("Missing TIINGO_TOKEN in environment.")
-
-sb = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-session = requests.Session()
-session.headers.update({"Accept": "application/json"})
-
+# Client, HTTP session and token are resolved on first use (see db.py), so
+# importing this module is cheap and a chained run reuses one connection pool.
 RUN_ID = str(uuid.uuid4())
 
+@lru_cache(maxsize=None)
+def tiingo_token() -> str:
+    load_dotenv()
+    token = os.environ.get("TIINGO_TOKEN")
+    if not token:
+        raise SystemExit("Missing TIINGO_TOKEN in environment.")
+    return token
+
 # ---------- Helpers ----------
 #def load_tickers(path=TICKERS_FILE):
 #    with open(path, "r") as f:
@@ -45,7 +43,7 @@ RUN_ID = str(uuid.uuid4())
 def load_tickers_from_db() -> list[str]:
     """Load ticker symbols directly from the Supabase 'tickers' table."""
     try:
-        res = sb.table("tickers").select("symbol").execute()
+        res = get_client().table("tickers").select("symbol").execute()
         if not res.data:
             print("[ERROR] No tickers found in database table 'tickers'.", file=sys.stderr)
             sys.exit(1)
@@ -75,7 +73,7 @@ def json_rows(df: pd.DataFrame) -> list:
     return json.loads(df.to_json(orient="records"))
 
 def get_last_date(ticker: str):
-    r = (sb.table("prices_daily")
+    r = (get_client().table("prices_daily")
           .select("dt")
           .eq("ticker", ticker.upper())
           .order("dt", desc=True)
@@ -110,7 +108,7 @@ def normalize_prices_df(df: pd.DataFrame, ticker: str, source: str) -> pd.DataFr
 def _tiingo_get(url: str, params: dict, max_retries=5) -> requests.Response:
     """Handle polite retries on 429/5xx."""
     for attempt in range(max_retries):
-        r = session.get(url, params=params, timeout=60)
+        r = get_session().get(url, params=params, timeout=60)
         if r.status_code not in (429, 500, 502, 503, 504):
             return r
         sleep_s = min(2 ** attempt, 30)
@@ -128,7 +126,7 @@ def fetch_tiingo_range(ticker: str, start: dt.date, end_exclusive: dt.date) -> p
         "startDate": start.strftime("%Y-%m-%d"),
         "endDate": end_inclusive,
         "format": "json",
-        "token": TIINGO_TOKEN,
+        "token": tiingo_token(),
     }
     r = _tiingo_get(url, params)
     if r.status_code == 404:
@@ -146,7 +144,7 @@ def fetch_tiingo_max(ticker: str) -> pd.DataFrame:
         "startDate": "1900-01-01",
         "endDate": today_ny.strftime("%Y-%m-%d"),
         "format": "json",
-        "token": TIINGO_TOKEN,
+        "token": tiingo_token(),
     }
     r = _tiingo_get(url, params)
     if r.status_code == 404:
@@ -161,6 +159,7 @@ def upsert_df(df: pd.DataFrame) -> int:
         return 0
     rows = json_rows(df)
     total = 0
+    sb = get_client()
     for i in range(0, len(rows), UPSERT_CHUNK):
         sb.table("prices_daily").upsert(
             rows[i:i+UPSERT_CHUNK], on_conflict="ticker,dt"
@@ -191,7 +190,7 @@ def log_ticker_result(
         "error_message": error_message,
     }
 
-    sb.table("prices_daily_log").insert(payload).execute()
+    get_client().table("prices_daily_log").insert(payload).execute()
 
 
 def parse_force_rebuild(env_val: str) -> tuple[bool, set[str]]:
@@ -205,12 +204,16 @@ def parse_force_rebuild(env_val: str) -> tuple[bool, set[str]]:
 
 # ---------- Main ----------
 def main():
-    tickers = load_tickers_from_db()
-    if len(sys.argv) > 1:
-        tickers = [sys.argv[1].upper()]
-        print(f"[INFO] Single-ticker update: {tickers[0]}")
+    run([sys.argv[1].upper()] if len(sys.argv) > 1 else None)
+
+def run(tickers=None):
+    if tickers:
+        print(f"[INFO] Updating only: {', '.join(tickers)}")
+    else:
+        tickers = load_tickers_from_db()
 
-    force_all, force_set = parse_force_rebuild(FORCE_REBUILD_ENV)
+    tiingo_token()                                    # fail fast before touching any ticker
+    force_all, force_set = parse_force_rebuild((os.environ.get("FORCE_REBUILD") or "").strip())
     today = dt.datetime.now(NY_TZ).date()
     end_exclusive = today + dt.timedelta(days=1)
 
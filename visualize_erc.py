@@ -1,43 +1,46 @@
 # visualize_erc.py
-import os
+import os, sys, json, hashlib
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+
+from clustering import load_corr, cluster_labels
+from risk_attribution import cluster_onehot
 
 OUTDIR = Path("outputs")
+MANIFEST_FILE = OUTDIR / ".viz_manifest.json"    # {figure: hash of its inputs} from the last render
+BACKEND = "Agg"                                  # headless; no display needed, safe in worker processes
+WORKERS = None                                   # render processes (None = os.cpu_count()); 1 = inline
+FORMATS = ["png"]                                # add "svg" for vector output (or pass --svg)
+EMIT_JSON = False                                # also write <figure>.json chart data (or pass --json)
 SCENARIOS = {
     "ledoit_wolf": OUTDIR / "erc_ledoit_wolf_pretty.csv",
     "winsor_lw":   OUTDIR / "erc_winsor_lw_pretty.csv",     # optional
-    "blend_70_30": OUTDIR / "erc_blend_70_30_pretty.csv"    # optional
+    "blend_70_30": OUTDIR / "erc_blend_70_30_pretty.csv",   # optional
+    "hrp_lw":      OUTDIR / "hrp_ledoit_wolf_pretty.csv",   # optional (compute_hrp.py)
+    "mcd":         OUTDIR / "erc_mcd_pretty.csv",           # optional
+    "huber":       OUTDIR / "erc_huber_pretty.csv",         # optional
+    "pairwise":    OUTDIR / "erc_pairwise_pretty.csv",      # optional
 }
 
-# --- Edit this cluster map to your liking ---
-CLUSTERS = {
-    # Payments / Fintech
-    "MA": "Payments", "V": "Payments", "FOUR": "Payments", "FICO": "Payments",
-    # Index / Ratings / Market Infra
-    "SPGI": "Index/Ratings", "MCO": "Index/Ratings", "MSCI": "Index/Ratings",
-    "ICE": "Market Infra", "TW": "Market Infra", "MKTX": "Market Infra",
-    # EDA / Semis
-    "SNPS": "EDA/Semis", "CDNS": "EDA/Semis", "ASML": "EDA/Semis", "TSM": "EDA/Semis",
-    # Enterprise Software
-    "NOW": "Enterprise SW", "WDAY": "Enterprise SW", "ADSK": "Enterprise SW", "TYL": "Enterprise SW",
-    # MedTech / Bio
-    "ISRG": "MedTech/Bio", "DHR": "MedTech/Bio", "MRVI": "MedTech/Bio",
-    # Real Estate / Info Services
-    "CSGP": "Info Services",
-    # Intl / Other
-    "6861.T": "Intl/Other",
-    "VACNY": "Intl/Other"
-}
+def load_clusters() -> dict:
+    """
+    {ticker: cluster label} cut from the correlation tree in clustering.py,
+    so new names in tickers.txt are grouped automatically.
+    """
+    try:
+        return cluster_labels(load_corr())
+    except FileNotFoundError as e:
+        print(f"[WARN] {e}; all tickers fall into 'Other'. Run compute_cov.py first.")
+        return {}
 
-def print_cluster_members():
+def print_cluster_members(clusters: dict):
     print("\n[Cluster Memberships]")
     cluster_map = {}
-    for t, c in CLUSTERS.items():
+    for t, c in clusters.items():
         cluster_map.setdefault(c, []).append(t)
-    for c, tickers in cluster_map.items():
+    for c, tickers in sorted(cluster_map.items()):
         print(f"{c:15s}: {', '.join(sorted(tickers))}")
 
 def load_scenario(path: Path) -> pd.DataFrame:
@@ -54,19 +57,32 @@ def load_scenario(path: Path) -> pd.DataFrame:
         raise ValueError(f"{path.name} missing columns: {missing}")
     return df
 
-def apply_clusters(df: pd.DataFrame) -> pd.DataFrame:
+def apply_clusters(df: pd.DataFrame, clusters: dict) -> pd.DataFrame:
     if df.empty:
         return df
     tickers = df.index.tolist()
-    df["cluster"] = [CLUSTERS.get(t, "Other") for t in tickers]
+    df["cluster"] = [clusters.get(t, "Other") for t in tickers]
     return df
 
-def bar_weights_vs_risk(df: pd.DataFrame, title: str, fname: str):
+def _plt():
+    """matplotlib is only imported when a chart is actually drawn."""
+    import matplotlib
+    matplotlib.use(BACKEND)
+    import matplotlib.pyplot as plt
+    return plt
+
+def _save(plt, fname: str, formats):
+    for ext in formats:
+        plt.savefig(OUTDIR / Path(fname).with_suffix(f".{ext}"), dpi=150)
+    plt.close()
+
+def bar_weights_vs_risk(df: pd.DataFrame, title: str, fname: str, formats=("png",)):
     if df.empty:
         return
     dfp = df.copy().sort_values("risk_share_%", ascending=False)
     x = np.arange(len(dfp.index))
     w = 0.4
+    plt = _plt()
     plt.figure(figsize=(14, 6))
     plt.bar(x - w/2, dfp["weight_%"].values, width=w, label="Weight %")
     plt.bar(x + w/2, dfp["risk_share_%"].values, width=w, label="Risk Share %")
@@ -75,8 +91,13 @@ def bar_weights_vs_risk(df: pd.DataFrame, title: str, fname: str):
     plt.ylabel("Percent")
     plt.legend()
     plt.tight_layout()
-    plt.savefig(OUTDIR / fname, dpi=150)
-    plt.close()
+    _save(plt, fname, formats)
+
+def weights_chart_data(df: pd.DataFrame, title: str) -> dict:
+    dfp = df.sort_values("risk_share_%", ascending=False)
+    return {"title": title, "tickers": dfp.index.tolist(),
+            "weight_pct": dfp["weight_%"].round(4).tolist(),
+            "risk_share_pct": dfp["risk_share_%"].round(4).tolist()}
 
 # ---------- NEW: helpers to put tickers INSIDE bar segments ----------
 
@@ -96,41 +117,40 @@ def wrap_tickers(tickers, per_line=3):
 
 # --------------------------------------------------------------------
 
-def cluster_stacked_bars(dfs: dict, title: str, fname: str):
+def cluster_table(dfs: dict):
     """
     dfs: dict name -> DataFrame (with 'cluster' and 'risk_contrib_vol')
-    Produces a stacked bar of risk_contrib_vol by cluster across scenarios,
-    and annotates each segment with that scenario's tickers for the cluster.
+    Returns (cluster x scenario table of absolute contributions,
+    {scenario: {cluster: wrapped ticker label}}), or (None, {}) if empty.
     """
-    # Build a combined cluster x scenario table of absolute contributions
-    rows = []
-    per_scen_labels = {}  # scenario -> {cluster: "T1, T2, ..."}
-    for scen, df in dfs.items():
-        if df.empty:
-            continue
-        g = df.groupby("cluster")["risk_contrib_vol"].sum()
-        for cl, val in g.items():
-            rows.append({"scenario": scen, "cluster": cl, "rc_vol": float(val)})
-        # build per-scenario labels
-        per_scen_labels[scen] = {cl: wrap_tickers(tks, per_line=3)
-                                 for cl, tks in tickers_by_cluster_for_scenario(df).items()}
-
-    if not rows:
-        return
+    dfs = {scen: df for scen, df in dfs.items() if not df.empty}
+    if not dfs:
+        return None, {}
 
-    tab = pd.DataFrame(rows)
-    piv = tab.pivot_table(index="cluster", columns="scenario",
-                          values="rc_vol", aggfunc="sum").fillna(0.0)
-    piv = piv.sort_index()  # alphabetical clusters
+    # scenario x ticker contributions, summed per cluster by one one-hot product
+    rc = pd.DataFrame({scen: dfs[scen]["risk_contrib_vol"] for scen in sorted(dfs)}).fillna(0.0)
+    labels = {t: c for df in dfs.values() for t, c in df["cluster"].items()}
+    names, G = cluster_onehot(rc.index.tolist(), labels)
+    piv = (pd.DataFrame(G.T @ rc.to_numpy(), index=names, columns=rc.columns)  # alphabetical clusters
+             .rename_axis(index="cluster", columns="scenario"))
 
-    # Save a CSV summary too
-    piv.to_csv(OUTDIR / "erc_cluster_risk_contrib_vol.csv")
+    # per-scenario labels: scenario -> {cluster: "T1, T2, ..."}
+    per_scen_labels = {scen: {cl: wrap_tickers(tks, per_line=3)
+                              for cl, tks in tickers_by_cluster_for_scenario(df).items()}
+                       for scen, df in dfs.items()}
+    return piv, per_scen_labels
 
+def cluster_stacked_bars(piv: pd.DataFrame, per_scen_labels: dict, title: str, fname: str, formats=("png",)):
+    """
+    Stacked bar of risk_contrib_vol by cluster across scenarios, with each
+    segment annotated with that scenario's tickers for the cluster.
+    """
     scenarios = list(piv.columns)
     clusters = list(piv.index)
     ind = np.arange(len(scenarios))
     bottom = np.zeros(len(scenarios))
 
+    plt = _plt()
     plt.figure(figsize=(12, 6))
     # draw stacked bars
     for cl in clusters:
@@ -159,39 +179,102 @@ def cluster_stacked_bars(dfs: dict, title: str, fname: str):
     # Keep legend for colors -> cluster names (tickers are printed inside bars)
     plt.legend(loc="best", ncols=2, fontsize=9, framealpha=0.9)
     plt.tight_layout()
-    plt.savefig(OUTDIR / fname, dpi=150)
-    plt.close()
+    _save(plt, fname, formats)
 
-def main():
+def cluster_chart_data(piv: pd.DataFrame, per_scen_labels: dict, title: str) -> dict:
+    return {"title": title, "scenarios": piv.columns.tolist(), "clusters": piv.index.tolist(),
+            "rc_vol": piv.round(6).to_numpy().tolist(), "labels": per_scen_labels}
+
+# ---------- incremental rendering ----------
+
+def input_hash(*parts) -> str:
+    """Content hash of everything a figure is drawn from (frames hashed by value, not by file)."""
+    h = hashlib.sha256()
+    for p in parts:
+        if isinstance(p, pd.DataFrame):
+            h.update(pd.util.hash_pandas_object(p, index=True).to_numpy().tobytes())
+            h.update(json.dumps(p.columns.tolist()).encode())
+        else:
+            h.update(json.dumps(p, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+def load_manifest() -> dict:
+    try:
+        return json.loads(MANIFEST_FILE.read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def is_current(manifest: dict, fname: str, key: str, formats) -> bool:
+    return manifest.get(fname) == key and all(
+        (OUTDIR / Path(fname).with_suffix(f".{ext}")).exists() for ext in formats)
+
+def render_all(jobs: list, workers=WORKERS):
+    """jobs: (fname, fn, args). Renders in a process pool (each worker imports matplotlib once)."""
+    if not jobs:
+        return
+    if workers == 1 or len(jobs) == 1:
+        for _, fn, args in jobs:
+            fn(*args)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [(fname, pool.submit(fn, *args)) for fname, fn, args in jobs]
+        for fname, fut in futures:
+            fut.result()                          # re-raise worker errors here
+
+def main(force: bool = False, formats=None, emit_json: bool = EMIT_JSON):
+    formats = list(dict.fromkeys(formats or FORMATS))
     os.makedirs(OUTDIR, exist_ok=True)
-    print_cluster_members()
+    clusters = load_clusters()
+    print_cluster_members(clusters)
 
     # Load scenarios (skip missing ones)
     data = {}
     for scen, path in SCENARIOS.items():
         df = load_scenario(path)
         if not df.empty:
-            df = apply_clusters(df)
+            df = apply_clusters(df, clusters)
             data[scen] = df
 
     if not data:
         print("[WARN] No ERC files found in outputs/. Run compute_erc.py first.")
         return
 
+    manifest = {} if force else load_manifest()
+    jobs, keys, charts = [], {}, {}
+
     # Per-scenario: Weights vs Risk Shares plot
     for scen, df in data.items():
         title = f"Weights vs Risk Shares — {scen}"
         fname = f"viz_weights_vs_risk_{scen}.png"
-        bar_weights_vs_risk(df, title, fname)
-        print(f"[OK] Saved {fname}")
+        keys[fname] = input_hash(df[["weight_%", "risk_share_%"]], title, formats)
+        charts[fname] = weights_chart_data(df, title)
+        jobs.append((fname, bar_weights_vs_risk, (df, title, fname, formats)))
 
     # Cross-scenario: Stacked bars of cluster risk contributions WITH TICKERS INSIDE
-    cluster_stacked_bars(
-        data,
-        "Risk Contributions by Cluster (absolute, across scenarios)",
-        "viz_cluster_risk_contribs.png"
-    )
-    print("[OK] Saved viz_cluster_risk_contribs.png")
+    piv, per_scen_labels = cluster_table(data)
+    if piv is not None:
+        piv.to_csv(OUTDIR / "erc_cluster_risk_contrib_vol.csv")   # CSV summary too
+        title = "Risk Contributions by Cluster (absolute, across scenarios)"
+        fname = "viz_cluster_risk_contribs.png"
+        keys[fname] = input_hash(piv, per_scen_labels, title, formats)
+        charts[fname] = cluster_chart_data(piv, per_scen_labels, title)
+        jobs.append((fname, cluster_stacked_bars, (piv, per_scen_labels, title, fname, formats)))
+
+    if emit_json:
+        for fname, chart in charts.items():
+            (OUTDIR / Path(fname).with_suffix(".json")).write_text(json.dumps(chart, separators=(",", ":")))
+
+    stale = [j for j in jobs if not is_current(manifest, j[0], keys[j[0]], formats)]
+    for fname in sorted(set(keys) - {j[0] for j in stale}):
+        print(f"[SKIP] {fname} unchanged")
+    render_all(stale)
+    for fname, _, _ in stale:
+        print(f"[OK] Saved {fname}" + (f" (+{', '.join(formats[1:])})" if len(formats) > 1 else ""))
+
+    manifest.update(keys)
+    MANIFEST_FILE.write_text(json.dumps(manifest, indent=2, sort_keys=True))
 
 if __name__ == "__main__":
-    main()
+    main(force="--force" in sys.argv,
+         formats=FORMATS + (["svg"] if "--svg" in sys.argv else []),
+         emit_json=EMIT_JSON or "--json" in sys.argv)